@@ -0,0 +1,140 @@
+# aggregations.py - Статистика по провайдерам за один проход по данным
+#
+# Замеры всех провайдеров складываются в одно "длинное" представление
+# (провайдер, город, скорость загрузки, скорость выгрузки), после чего
+# количество, средние, перцентили и разбивка по городам считаются
+# через np.bincount и одну частичную сортировку на провайдера - без отдельных
+# отфильтрованных копий DataFrame для каждого провайдера.
+import numpy as np
+import pandas as pd
+
+from data_index import LAT_COLUMN, LNG_COLUMN, PROVIDERS
+
+# Перцентили скорости, добавляемые в статистику провайдера
+PERCENTILES = (10, 50, 90)
+
+
+# Статистика провайдера без данных
+def _empty_provider_stats():
+    return {
+        'count': 0,
+        'avg_download': 0,
+        'avg_upload': 0,
+        'download_percentiles': {f"p{q}": 0 for q in PERCENTILES},
+        'upload_percentiles': {f"p{q}": 0 for q in PERCENTILES}
+    }
+
+
+# Функция для вычисления перцентилей по группам (линейная интерполяция, как у pandas)
+# Группы идут в values подряд; все перцентили группы находятся одной частичной
+# сортировкой (np.partition по всем нужным позициям сразу)
+def _group_percentiles(values, starts, counts):
+    result = {f"p{q}": np.full(len(starts), np.nan) for q in PERCENTILES}
+    fractions = np.asarray(PERCENTILES, dtype=float) / 100
+    for group, (start, count) in enumerate(zip(starts, counts)):
+        segment = values[start:start + count]
+        segment = segment[~np.isnan(segment)]
+        if len(segment) == 0:
+            continue
+        position = fractions * (len(segment) - 1)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.ceil(position).astype(np.intp)
+        segment.partition(np.unique(np.concatenate((lower, upper))))
+        quantiles = segment[lower] + (segment[upper] - segment[lower]) * (position - lower)
+        for q, value in zip(PERCENTILES, quantiles):
+            result[f"p{q}"][group] = value
+    return result
+
+
+# Функция для получения статистики
+def get_statistics(data):
+    if data.empty:
+        return {
+            'total_points': 0,
+            'providers': {name: _empty_provider_stats() for name in PROVIDERS},
+            'cities': {},
+            'cities_providers': {}
+        }
+
+    # Учитываем только строки с заполненными координатами
+    valid = ~(data[LAT_COLUMN].isna().to_numpy() | data[LNG_COLUMN].isna().to_numpy())
+    total_points = int(valid.sum())
+
+    # Коды городов всех строк (отсортированы по названию); 0 - город не указан
+    if 'isb_town' in data.columns:
+        all_city_codes, towns = pd.factorize(data['isb_town'], sort=True)
+        all_city_codes += 1
+    else:
+        all_city_codes, towns = np.zeros(len(data), dtype=np.int64), []
+    city_codes = all_city_codes[valid]
+
+    # Длинное представление: одна запись на замер провайдера. Строки выбираются
+    # одной маской по всему кадру, колонки читаются одной выборкой по номерам строк
+    provider_parts, city_parts, download_parts, upload_parts = [], [], [], []
+    for code, name in enumerate(PROVIDERS):
+        rows = np.flatnonzero(valid & (data[f"{name}_speedtest"].to_numpy(dtype=float) == 1))
+        provider_parts.append(np.full(len(rows), code, dtype=np.int64))
+        city_parts.append(all_city_codes[rows])
+        download_parts.append(data[f"{name}_download_speed"].to_numpy(dtype=float)[rows])
+        upload_parts.append(data[f"{name}_upload_speed"].to_numpy(dtype=float)[rows])
+    provider = np.concatenate(provider_parts)
+    download = np.concatenate(download_parts)
+    upload = np.concatenate(upload_parts)
+
+    # Ключ группировки (город, провайдер); итоги провайдеров - суммы по городам
+    n_providers = len(PROVIDERS)
+    n_cities = len(towns) + 1
+    key = np.concatenate(city_parts) * n_providers + provider
+    size = n_cities * n_providers
+    pair_counts = np.bincount(key, minlength=size).reshape(n_cities, n_providers)
+    counts = pair_counts.sum(axis=0)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    pair_means = {}
+    speeds = {}
+    for label, values in (('download', download), ('upload', upload)):
+        present = ~np.isnan(values)
+        sums = np.bincount(key, weights=np.where(present, values, 0.0), minlength=size).reshape(n_cities, n_providers)
+        valid_counts = np.bincount(key, weights=present, minlength=size).reshape(n_cities, n_providers)
+        pair_means[label] = np.where(valid_counts > 0, sums / np.maximum(valid_counts, 1), 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums.sum(axis=0) / valid_counts.sum(axis=0)
+        # Длинное представление уже сгруппировано по провайдеру
+        speeds[label] = (means, _group_percentiles(values, starts, counts))
+
+    providers = {}
+    for code, name in enumerate(PROVIDERS):
+        if counts[code] == 0:
+            providers[name] = _empty_provider_stats()
+            continue
+        stats = {'count': int(counts[code])}
+        for label in ('download', 'upload'):
+            means, percentiles = speeds[label]
+            stats[f"avg_{label}"] = float(means[code])
+            stats[f"{label}_percentiles"] = {q: float(values[code]) for q, values in percentiles.items()}
+        providers[name] = stats
+
+    # Разбивка по городам: количество точек и замеры каждого провайдера
+    cities = {}
+    cities_providers = {}
+    town_counts = np.bincount(city_codes, minlength=n_cities)
+    for t, town in enumerate(towns, start=1):
+        # Города, встречающиеся только в строках без координат, не учитываются
+        if town_counts[t] == 0:
+            continue
+        cities[town] = int(town_counts[t])
+        cities_providers[town] = {
+            name: {
+                'count': int(pair_counts[t, code]),
+                'avg_download': float(pair_means['download'][t, code]),
+                'avg_upload': float(pair_means['upload'][t, code])
+            }
+            for code, name in enumerate(PROVIDERS)
+        }
+
+    return {
+        'total_points': total_points,
+        'providers': providers,
+        'cities': cities,
+        'cities_providers': cities_providers
+    }
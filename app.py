@@ -1,25 +1,99 @@
 from flask import Flask, render_template, request, jsonify
-import pandas as pd
 import numpy as np
-import folium
-from folium.plugins import HeatMap, MarkerCluster
-import plotly.express as px
-import plotly.graph_objects as go
+import hmac
 import json
 import os
+import signal
+import threading
+from map_payload import (points_json, heatmap_json, points_columnar, heatmap_columnar, points_binary,
+                         heatmap_binary, provider_mask, empty_payload, PAYLOAD_FORMATS)
+from data_index import PROVIDERS
+from clustering import PRECOMPUTED_MAX_ZOOM, clamp_zoom
+from tiles import LAYERS, MAX_TILE_ZOOM, EMPTY_TILE, TILE_CACHE_DIR
+from cache import LRUCache
+from aggregations import get_statistics
+from chart_specs import create_charts
+from filters import DataQuery, QueryError, parse_bbox
+from rollups import LEVELS as ROLLUP_LEVELS
+from dataset import DatasetManager, current_rss
+from snapshot import SNAPSHOT_DIR
+from responses import make_etag, not_modified, not_modified_response, payload_response
+from export import EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES, export_stream, parquet_available
+import metrics
+from metrics import MetricsRegistry, phase, record_rows, PROMETHEUS_CONTENT_TYPE
+from profiler import SamplingProfiler, DEFAULT_INTERVAL as DEFAULT_PROFILER_INTERVAL, MIN_INTERVAL as MIN_PROFILER_INTERVAL
 
 app = Flask(__name__)
 
-# Загрузка данных
-try:
-    df = pd.read_excel('data/cbm_st_pro_1.xlsx')
-    print(f"Данные загружены успешно. Количество строк: {len(df)}")
-except Exception as e:
-    print(f"Ошибка при загрузке данных: {e}")
-    df = pd.DataFrame()  # Пустой DataFrame в случае ошибки
+# Путь к исходному файлу данных
+DATA_PATH = os.environ.get('DATA_PATH', 'data/cbm_st_pro_1.xlsx')
+
+# Каталог снимков данных
+DATA_SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', SNAPSHOT_DIR)
+
+# Каталог кэша тайлов (пустое значение или off - кэш на диске отключен)
+DATA_TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', TILE_CACHE_DIR)
+if DATA_TILE_CACHE_DIR.strip().lower() in ('', 'off'):
+    DATA_TILE_CACHE_DIR = None
+
+# Загрузка данных (через колоночный снимок, см. snapshot.py) вместе с индексами.
+# Текущая версия данных доступна как datasets.current и может быть заменена
+# без перезапуска (см. dataset.py)
+datasets = DatasetManager(DATA_PATH, DATA_SNAPSHOT_DIR, DATA_TILE_CACHE_DIR)
+datasets.load_initial()
+
+# Приложение обслуживается рабочими процессами serve.py или gunicorn (задают они сами):
+# данные перезагружает главный процесс, чтобы все рабочие процессы получили
+# одну версию и разделяли ее страницы памяти
+MULTIPROCESS = False
+
+# Кэш статистики и графиков (размер и время жизни задаются переменными окружения)
+STATS_CACHE_SIZE = int(os.environ.get('STATS_CACHE_SIZE', 64))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 0)) or None
+stats_cache = LRUCache(maxsize=STATS_CACHE_SIZE, ttl=STATS_CACHE_TTL)
+
+# Записи кэша привязаны к версии данных; при замене версии старые записи удаляются
+datasets.listeners.append(lambda new, old: stats_cache.clear())
+
+# Значения фильтра скорости по умолчанию для карты и аналитики
+SPEED_DEFAULTS = {'min_speed': 0.0, 'max_speed': 500.0}
+
+# Выгрузка: строк в одной части ответа, максимум строк (0 - без ограничения)
+# и число одновременных выгрузок в процессе
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 10000))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', 1000000))
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 2))
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+# Метрики запросов: этапы обработки (Server-Timing), строки, байты, кэш (см. metrics.py)
+registry = MetricsRegistry()
+metrics.init_app(app, registry)
+
+# Выборочный профилировщик: включается через /admin/profiler или PROFILER=1
+profiler = SamplingProfiler(float(os.environ.get('PROFILER_INTERVAL', DEFAULT_PROFILER_INTERVAL)))
+
+# Функция для обновления метрик состояния перед выдачей /metrics
+def collect_state(registry):
+    ds = datasets.current
+    registry.set('app_dataset_rows', value=len(ds.data))
+    # Версия в app_dataset_info одна: метка прежней версии удаляется
+    registry.clear('app_dataset_info')
+    registry.set('app_dataset_info', (ds.version,), 1)
+    info = stats_cache.info()
+    registry.set('app_stats_cache_entries', value=info['size'])
+    registry.set('process_resident_memory_bytes', value=current_rss())
+
+registry.gauge('app_dataset_rows', 'Количество строк в текущей версии данных')
+registry.gauge('app_dataset_info', 'Текущая версия данных', ('version',))
+registry.gauge('app_stats_cache_entries', 'Количество записей в кэше статистики')
+registry.gauge('process_resident_memory_bytes', 'Резидентная память процесса')
+registry.collectors.append(collect_state)
 
 # Функция для создания базовой карты
 def create_base_map():
+    # folium нужен только здесь и импортируется при первом вызове
+    import folium
+    
     # Центрируем карту на Астане
     m = folium.Map(location=[51.1605, 71.4704], zoom_start=12, tiles='CartoDB positron')
     return m
@@ -53,195 +127,79 @@ def validate_data(data):
     print(f"Данные прошли валидацию. Валидных строк: {len(valid_data)}")
     return True
 
-# Функция для получения статистики
-def get_statistics(data):
-    if data.empty:
-        return {
-            'total_points': 0,
-            'providers': {
-                'kt': {'count': 0, 'avg_download': 0, 'avg_upload': 0},
-                'beeline': {'count': 0, 'avg_download': 0, 'avg_upload': 0},
-                'almatv': {'count': 0, 'avg_download': 0, 'avg_upload': 0}
-            }
-        }
-    
-    # Очищаем данные от NaN в координатах
-    data = data.dropna(subset=['latitude_speedtest', 'longitude_speedtest'])
-    
-    stats = {
-        'total_points': len(data),
-        'providers': {
-            'kt': {
-                'count': int(data['kt_speedtest'].sum()),
-                'avg_download': float(data[data['kt_speedtest'] == 1]['kt_download_speed'].mean()) if data[data['kt_speedtest'] == 1].shape[0] > 0 else 0,
-                'avg_upload': float(data[data['kt_speedtest'] == 1]['kt_upload_speed'].mean()) if data[data['kt_speedtest'] == 1].shape[0] > 0 else 0
-            },
-            'beeline': {
-                'count': int(data['beeline_speedtest'].sum()),
-                'avg_download': float(data[data['beeline_speedtest'] == 1]['beeline_download_speed'].mean()) if data[data['beeline_speedtest'] == 1].shape[0] > 0 else 0,
-                'avg_upload': float(data[data['beeline_speedtest'] == 1]['beeline_upload_speed'].mean()) if data[data['beeline_speedtest'] == 1].shape[0] > 0 else 0
-            },
-            'almatv': {
-                'count': int(data['almatv_speedtest'].sum()),
-                'avg_download': float(data[data['almatv_speedtest'] == 1]['almatv_download_speed'].mean()) if data[data['almatv_speedtest'] == 1].shape[0] > 0 else 0,
-                'avg_upload': float(data[data['almatv_speedtest'] == 1]['almatv_upload_speed'].mean()) if data[data['almatv_speedtest'] == 1].shape[0] > 0 else 0
-            }
-        }
-    }
-    
-    # Добавляем статистику по городам, если есть колонка isb_town
-    if 'isb_town' in data.columns:
-        stats['cities'] = data.groupby('isb_town').size().to_dict()
-    else:
-        stats['cities'] = {}
-    
-    return stats
+# Функция для получения статистики с кэшированием по версии данных и фильтрам
+def cached_statistics(ds, query=None):
+    query = query or DataQuery()
+    key = ('stats', ds.version) + query.key()
+    
+    def compute():
+        with phase('filter'):
+            data = ds.frame(query)
+        record_rows(len(data))
+        with phase('aggregate'):
+            return get_statistics(data)
+    
+    return metrics.cached(registry, stats_cache, 'stats', key, compute)
 
-# Функция для создания графиков
-def create_charts(data, stats):
-    if data.empty:
-        # Создаем пустые графики с сообщением об отсутствии данных
-        empty_message = "Нет данных для отображения"
-        
-        kt_hist = px.histogram(title='Распределение скорости Казахтелеком')
-        kt_hist.update_layout(annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        beeline_hist = px.histogram(title='Распределение скорости Beeline')
-        beeline_hist.update_layout(annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        almatv_hist = px.histogram(title='Распределение скорости AlmaTV')
-        almatv_hist.update_layout(annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        providers_comparison = go.Figure()
-        providers_comparison.update_layout(title='Сравнение средних скоростей провайдеров',
-                                          annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        providers_pie = go.Figure()
-        providers_pie.update_layout(title='Доля провайдеров по количеству точек',
-                                   annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        cities_bar = px.bar(title='Топ-10 городов по количеству точек')
-        cities_bar.update_layout(annotations=[dict(text=empty_message, showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-    else:
-        # Очищаем данные от NaN в координатах
-        data = data.dropna(subset=['latitude_speedtest', 'longitude_speedtest'])
-        
-        # 1. Гистограммы распределения скорости для каждого провайдера
-        kt_data = data[data['kt_speedtest'] == 1]
-        beeline_data = data[data['beeline_speedtest'] == 1]
-        almatv_data = data[data['almatv_speedtest'] == 1]
-        
-        if len(kt_data) > 0:
-            kt_hist = px.histogram(kt_data, x='kt_download_speed', nbins=20, 
-                                  title='Распределение скорости Казахтелеком',
-                                  labels={'kt_download_speed': 'Скорость (Мбит/с)', 'count': 'Количество точек'},
-                                  color_discrete_sequence=['#0056A4'])
-        else:
-            kt_hist = px.histogram(title='Распределение скорости Казахтелеком')
-            kt_hist.update_layout(annotations=[dict(text="Нет данных для Казахтелеком", showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        if len(beeline_data) > 0:
-            beeline_hist = px.histogram(beeline_data, x='beeline_download_speed', nbins=20,
-                                       title='Распределение скорости Beeline',
-                                       labels={'beeline_download_speed': 'Скорость (Мбит/с)', 'count': 'Количество точек'},
-                                       color_discrete_sequence=['#FFCC00'])
-        else:
-            beeline_hist = px.histogram(title='Распределение скорости Beeline')
-            beeline_hist.update_layout(annotations=[dict(text="Нет данных для Beeline", showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        if len(almatv_data) > 0:
-            almatv_hist = px.histogram(almatv_data, x='almatv_download_speed', nbins=20,
-                                      title='Распределение скорости AlmaTV',
-                                      labels={'almatv_download_speed': 'Скорость (Мбит/с)', 'count': 'Количество точек'},
-                                      color_discrete_sequence=['#FF6600'])
-        else:
-            almatv_hist = px.histogram(title='Распределение скорости AlmaTV')
-            almatv_hist.update_layout(annotations=[dict(text="Нет данных для AlmaTV", showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-        
-        # 2. Сравнение средних скоростей провайдеров
-        providers_comparison = go.Figure(data=[
-            go.Bar(name='Скорость загрузки', 
-                   x=['Казахтелеком', 'Beeline', 'AlmaTV'], 
-                   y=[stats['providers']['kt']['avg_download'], 
-                      stats['providers']['beeline']['avg_download'], 
-                      stats['providers']['almatv']['avg_download']],
-                   marker_color=['#0056A4', '#FFCC00', '#FF6600']),
-            go.Bar(name='Скорость выгрузки', 
-                   x=['Казахтелеком', 'Beeline', 'AlmaTV'], 
-                   y=[stats['providers']['kt']['avg_upload'], 
-                      stats['providers']['beeline']['avg_upload'], 
-                      stats['providers']['almatv']['avg_upload']],
-                   marker_color=['#4D94DB', '#FFE066', '#FF9966'])
-        ])
-        providers_comparison.update_layout(title='Сравнение средних скоростей провайдеров',
-                                          xaxis_title='Провайдер',
-                                          yaxis_title='Скорость (Мбит/с)',
-                                          barmode='group')
-        
-        # 3. Круговая диаграмма доли провайдеров
-        providers_pie = go.Figure(data=[go.Pie(
-            labels=['Казахтелеком', 'Beeline', 'AlmaTV'],
-            values=[stats['providers']['kt']['count'], 
-                    stats['providers']['beeline']['count'], 
-                    stats['providers']['almatv']['count']],
-            marker_colors=['#0056A4', '#FFCC00', '#FF6600'],
-            hole=.3
-        )])
-        providers_pie.update_layout(title='Доля провайдеров по количеству точек')
-        
-        # 4. Топ-10 городов по количеству точек
-        if 'cities' in stats and stats['cities']:
-            cities_data = pd.DataFrame(list(stats['cities'].items()), columns=['city', 'count'])
-            cities_data = cities_data.sort_values('count', ascending=False).head(10)
-            
-            cities_bar = px.bar(cities_data, x='city', y='count',
-                               title='Топ-10 городов по количеству точек',
-                               labels={'city': 'Город', 'count': 'Количество точек'},
-                               color_discrete_sequence=['#0056A4'])
-        else:
-            cities_bar = px.bar(title='Топ-10 городов по количеству точек')
-            cities_bar.update_layout(annotations=[dict(text="Нет данных о городах", showarrow=False, xref="paper", yref="paper", x=0.5, y=0.5)])
-    
-    # Преобразуем графики в JSON для передачи в шаблон
-    charts = {
-        'kt_hist': kt_hist.to_json(),
-        'beeline_hist': beeline_hist.to_json(),
-        'almatv_hist': almatv_hist.to_json(),
-        'providers_comparison': providers_comparison.to_json(),
-        'providers_pie': providers_pie.to_json(),
-        'cities_bar': cities_bar.to_json()
-    }
-    
-    return charts
+# Функция для получения графиков (JSON) с кэшированием по версии данных и фильтрам
+def cached_charts(ds, query=None):
+    query = query or DataQuery()
+    key = ('charts', ds.version) + query.key()
+    
+    def compute():
+        stats = cached_statistics(ds, query)
+        with phase('filter'):
+            data = ds.frame(query)
+        with phase('serialize'):
+            return create_charts(data, stats)
+    
+    return metrics.cached(registry, stats_cache, 'charts', key, compute)
+
+# Функция для прогрева кэша частыми комбинациями фильтров
+def warm_stats_cache(ds):
+    for provider in ('all',) + PROVIDERS:
+        cached_charts(ds, DataQuery(provider, **SPEED_DEFAULTS))
+
+# Ошибки в параметрах фильтрации возвращаются клиенту с кодом 400
+@app.errorhandler(QueryError)
+def handle_query_error(error):
+    return jsonify({'error': str(error)}), 400
 
 # Главная страница с картой
 @app.route('/')
 def index():
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    
     # Проверяем данные
-    if df.empty:
+    if ds.empty:
         return render_template('error.html', message="Ошибка загрузки данных. Проверьте файл данных.")
     
-    # Получаем статистику
-    stats = get_statistics(df)
+    # Получаем статистику (тот же фильтр по умолчанию, что у интерфейса и /get_stats)
+    query = DataQuery(**SPEED_DEFAULTS)
+    stats = cached_statistics(ds, query)
     
     # Создаем графики
-    charts = create_charts(df, stats)
+    charts = cached_charts(ds, query)
     
     return render_template('index.html', stats=stats, charts=charts)
 
 # Страница аналитики
 @app.route('/analytics')
 def analytics():
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    
     # Проверяем данные
-    if df.empty:
+    if ds.empty:
         return render_template('error.html', message="Ошибка загрузки данных. Проверьте файл данных.")
     
-    # Получаем статистику
-    stats = get_statistics(df)
+    # Получаем статистику (тот же фильтр по умолчанию, что у интерфейса и /get_stats)
+    query = DataQuery(**SPEED_DEFAULTS)
+    stats = cached_statistics(ds, query)
     
     # Создаем графики
-    charts = create_charts(df, stats)
+    charts = cached_charts(ds, query)
     
     return render_template('analytics.html', stats=stats, charts=charts)
 
@@ -249,161 +207,327 @@ def analytics():
 @app.route('/get_map', methods=['GET'])
 def get_map():
     # Получаем параметры фильтрации
-    provider = request.args.get('provider', 'all')
-    min_speed = float(request.args.get('min_speed', 0))
-    max_speed = float(request.args.get('max_speed', 500))
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
     map_type = request.args.get('map_type', 'points')
     
-    # Проверка данных перед обработкой
-    if df.empty:
-        return jsonify([])
-    
-    # Фильтрация данных
-    filtered_data = df.copy()
-    
-    # Удаляем строки с отсутствующими координатами
-    filtered_data = filtered_data.dropna(subset=['latitude_speedtest', 'longitude_speedtest'])
-    
-    # Определяем колонку скорости в зависимости от провайдера
-    if provider != 'all':
-        if provider == 'kt':
-            filtered_data = filtered_data[filtered_data['kt_speedtest'] == 1]
-            speed_column = 'kt_download_speed'
-        elif provider == 'beeline':
-            filtered_data = filtered_data[filtered_data['beeline_speedtest'] == 1]
-            speed_column = 'beeline_download_speed'
-        elif provider == 'almatv':
-            filtered_data = filtered_data[filtered_data['almatv_speedtest'] == 1]
-            speed_column = 'almatv_download_speed'
-    else:
-        # Для всех провайдеров используем максимальную скорость из доступных
-        filtered_data['max_download_speed'] = filtered_data[['kt_download_speed', 'beeline_download_speed', 'almatv_download_speed']].max(axis=1, skipna=True)
-        speed_column = 'max_download_speed'
+    # Формат ответа: json (массив объектов), columnar или binary
+    payload_format = request.args.get('format', 'json')
+    if payload_format not in PAYLOAD_FORMATS:
+        raise QueryError(f"Неизвестный формат: {payload_format}")
+    mimetype = 'application/octet-stream' if payload_format == 'binary' else 'application/json'
     
-    # Фильтрация по скорости
-    filtered_data = filtered_data[(filtered_data[speed_column] >= min_speed) & 
-                                 (filtered_data[speed_column] <= max_speed)]
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    data_index = ds.index
     
-    # Проверяем, остались ли данные после фильтрации
-    if len(filtered_data) == 0:
-        return jsonify([])
+    # Ответ определяется версией данных и параметрами: неизменившийся результат - 304
+    etag = make_etag(ds.version, 'map', map_type, payload_format, query.key())
+    if not_modified(etag):
+        return not_modified_response(etag)
+    
+    # Проверка данных перед обработкой
+    if ds.empty:
+        return payload_response(empty_payload(map_type, payload_format), mimetype, etag)
     
-    # Выводим информацию о количестве точек для отладки
-    print(f"Количество точек для отображения: {len(filtered_data)}")
-    print(f"Пример координат: {filtered_data[['latitude_speedtest', 'longitude_speedtest']].head(3).values}")
+    # Фильтрация данных через индекс: выбираем только нужные строки
+    with phase('filter'):
+        rows = query.positions(data_index)
+    record_rows(len(rows))
     
-    # Подготовка данных для фронтенда
-    points = []
+    # Проверяем, остались ли данные после фильтрации
+    if len(rows) == 0:
+        return payload_response(empty_payload(map_type, payload_format), mimetype, etag)
     
+    with phase('aggregate'):
+        lat = data_index.lat[rows]
+        lng = data_index.lng[rows]
+        speed = data_index.speed[query.provider][rows]
+        
+        # Провайдеры в выбранных точках
+        flags = {name: data_index.flags[name][rows] for name in PROVIDERS}
+
+    # Подготовка данных для фронтенда: колонки сериализуются целиком, без iterrows
+    with phase('serialize'):
+        body = map_body(data_index, rows, map_type, payload_format, lat, lng, speed, flags)
+
+    with phase('compress'):
+        return payload_response(body, mimetype, etag)
+
+# Функция для сериализации точек карты в выбранном формате
+def map_body(data_index, rows, map_type, payload_format, lat, lng, speed, flags):
     # Если запрошен тип карты с точками
     if map_type == 'points':
-        for _, row in filtered_data.iterrows():
-            # Определяем скорость для текущей точки
-            if provider != 'all':
-                current_speed = row[speed_column]
-            else:
-                current_speed = row['max_download_speed']
-                
-            # Определяем цвет маркера в зависимости от скорости
-            if current_speed < 50:
-                color = 'red'
-            elif current_speed < 100:
-                color = 'orange'
-            else:
-                color = 'green'
-            
-            # Создаем объект точки
-            point = {
-                'lat': float(row['latitude_speedtest']),
-                'lng': float(row['longitude_speedtest']),
-                'speed': float(current_speed),
-                'color': color,
-                'providers': {
-                    'kt': bool(row['kt_speedtest'] == 1),
-                    'beeline': bool(row['beeline_speedtest'] == 1),
-                    'almatv': bool(row['almatv_speedtest'] == 1)
-                },
-                'address': row['address'] if 'address' in row else 'Точка интернета'
-            }
-            points.append(point)
-    
+        if payload_format == 'json':
+            body = points_json(lat, lng, speed, kt=flags['kt'], beeline=flags['beeline'], almatv=flags['almatv'],
+                               address_literals=data_index.address_literals(rows))
+        else:
+            # Компактные форматы: маска провайдеров и таблица уникальных адресов
+            providers = provider_mask(flags['kt'], flags['beeline'], flags['almatv'])
+            address_codes, addresses = data_index.address_subset(rows)
+            encode = points_columnar if payload_format == 'columnar' else points_binary
+            body = encode(lat, lng, speed, providers, address_codes, addresses)
     # Если запрошен тип карты с тепловой картой
     elif map_type.startswith('heatmap'):
-        for _, row in filtered_data.iterrows():
-            # Определяем значение для тепловой карты
-            if map_type == 'heatmap_speed':
-                # Для тепловой карты по скорости используем значение скорости
-                value = float(row[speed_column])
-            else:
-                # Для тепловой карты по плотности используем константное значение
-                value = 1
-                
-            # Создаем объект точки для тепловой карты
-            point = {
-                'lat': float(row['latitude_speedtest']),
-                'lng': float(row['longitude_speedtest']),
-                'value': value
-            }
-            points.append(point)
-    
-    # Отладочная информация о количестве маркеров
-    if map_type == 'points':
-        print(f"Добавлено маркеров Казахтелеком: {len(filtered_data[filtered_data['kt_speedtest'] == 1])}")
-        print(f"Добавлено маркеров Beeline: {len(filtered_data[filtered_data['beeline_speedtest'] == 1])}")
-        print(f"Добавлено маркеров AlmaTV: {len(filtered_data[filtered_data['almatv_speedtest'] == 1])}")
+        # Для тепловой карты по скорости используем значение скорости,
+        # для тепловой карты по плотности - константное значение
+        values = speed if map_type == 'heatmap_speed' else None
+        if payload_format == 'json':
+            body = heatmap_json(lat, lng, values)
+        elif payload_format == 'columnar':
+            body = heatmap_columnar(lat, lng, values)
+        else:
+            body = heatmap_binary(lat, lng, values)
+    else:
+        body = empty_payload(map_type, payload_format)
+    return body
+
+# API для получения кластеров точек в области просмотра
+@app.route('/get_clusters', methods=['GET'])
+def get_clusters():
+    # Получаем параметры фильтрации и области просмотра (скорость по умолчанию - как у слайдера)
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
+    try:
+        zoom = clamp_zoom(float(request.args.get('zoom', 0)))
+    except ValueError:
+        raise QueryError(f"Некорректный масштаб: {request.args.get('zoom')}")
+    # На крупных масштабах без области просмотра ответ содержал бы все точки
+    if zoom > PRECOMPUTED_MAX_ZOOM and query.bbox is None:
+        raise QueryError(f"Для масштаба больше {PRECOMPUTED_MAX_ZOOM} нужен параметр bbox")
+    
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    
+    # Неизменившийся результат для той же области и масштаба - 304
+    etag = make_etag(ds.version, 'clusters', zoom, query.key())
+    if not_modified(etag):
+        return not_modified_response(etag)
+    
+    # Проверка данных перед обработкой
+    if ds.empty:
+        return jsonify({'clusters': [], 'points': [], 'zoom': zoom})
+    
+    with phase('filter'):
+        table, positions = ds.clusters.query(query, zoom)
+    # Строки в кластерах и отдельные точки
+    record_rows(len(positions) + (int(table.count.sum()) if table is not None else 0))
+    with phase('serialize'):
+        body = ds.clusters.to_json(query.provider, table, positions, zoom)
+    
+    with phase('compress'):
+        return payload_response(body, 'application/json', etag)
+
+# API для получения агрегатов покрытия по городам или ячейкам geohash
+@app.route('/get_rollup', methods=['GET'])
+def get_rollup():
+    level = request.args.get('level', 'city')
+    if level not in ROLLUP_LEVELS:
+        raise QueryError(f"Неизвестный уровень агрегации: {level}")
+    bbox = parse_bbox(request.args.get('bbox'))
+    
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    
+    # Агрегаты зависят только от версии данных, уровня и области
+    etag = make_etag(ds.version, 'rollup', level, bbox)
+    if not_modified(etag):
+        return not_modified_response(etag)
+    
+    # Проверка данных перед обработкой
+    if ds.empty:
+        return jsonify({'level': level, 'cells': []})
+    
+    with phase('serialize'):
+        body = ds.rollups.to_json(level, bbox)
     
-    return jsonify(points)
+    with phase('compress'):
+        return payload_response(body, 'application/json', etag)
+
+# API для потоковой выгрузки отфильтрованных строк (CSV, NDJSON, Parquet)
+@app.route('/export', methods=['GET'])
+def export():
+    # Получаем параметры фильтрации и формат (скорость по умолчанию - как у слайдера)
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise QueryError(f"Неизвестный формат выгрузки: {export_format}")
+    if export_format == 'parquet' and not parquet_available():
+        raise QueryError("Выгрузка в Parquet недоступна: не установлен pyarrow")
+    
+    # Ограничение числа строк: параметр limit, но не больше EXPORT_MAX_ROWS
+    limit = EXPORT_MAX_ROWS or None
+    if request.args.get('limit'):
+        try:
+            requested = int(request.args['limit'])
+        except ValueError:
+            raise QueryError(f"Некорректный limit: {request.args['limit']}")
+        if requested <= 0:
+            raise QueryError(f"Некорректный limit: {requested}")
+        limit = min(requested, limit) if limit else requested
+    
+    # Текущая версия данных (генератор работает с ней до конца выгрузки)
+    ds = datasets.current
+    with phase('filter'):
+        rows = np.empty(0, dtype=np.intp) if ds.empty else ds.index.row_ids[query.positions(ds.index)]
+    total_rows = len(rows)
+    if limit is not None:
+        rows = rows[:limit]
+    record_rows(len(rows))
+    
+    # Одновременных выгрузок не больше EXPORT_MAX_CONCURRENT
+    if not export_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Слишком много одновременных выгрузок, повторите позже'})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    response = app.response_class(export_stream(export_format, ds.data, rows, EXPORT_CHUNK_ROWS),
+                                  mimetype=EXPORT_MIMETYPES[export_format])
+    response.call_on_close(export_slots.release)
+    response.headers['Content-Disposition'] = f'attachment; filename="export-{ds.version}.{export_format}"'
+    response.headers['X-Export-Rows'] = str(len(rows))
+    response.headers['X-Export-Truncated'] = '1' if len(rows) < total_rows else '0'
+    return response
+
+# API для получения тайла тепловой карты (PNG)
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    # Получаем параметры слоя и фильтрации
+    layer = request.args.get('layer', 'density')
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
+    
+    if layer not in LAYERS:
+        raise QueryError(f"Неизвестный слой: {layer}")
+    
+    # Текущая версия данных (не меняется до конца запроса)
+    ds = datasets.current
+    
+    # Пустой тайл, если данных нет или тайл вне допустимой сетки
+    if ds.empty or not (0 <= z <= MAX_TILE_ZOOM) or not (0 <= x < (1 << z)) or not (0 <= y < (1 << z)):
+        png = EMPTY_TILE
+    else:
+        with phase('render'):
+            png = ds.tiles.tile(layer, query, z, x, y)
+    
+    return app.response_class(png, mimetype='image/png')
 
 # Маршрут для получения статистики
 @app.route('/get_stats')
 def get_stats():
-    # Получаем параметры фильтрации
-    provider = request.args.get('provider', 'all')
-    min_speed = float(request.args.get('min_speed', 0))
-    max_speed = float(request.args.get('max_speed', 500))
-    
-    # Фильтруем данные
-    filtered_data = df.copy()
+    # Получаем параметры фильтрации (тот же набор строк, что и на карте)
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
     
-    if provider != 'all':
-        if provider == 'kt':
-            filtered_data = filtered_data[filtered_data['kt_speedtest'] == 1]
-        elif provider == 'beeline':
-            filtered_data = filtered_data[filtered_data['beeline_speedtest'] == 1]
-        elif provider == 'almatv':
-            filtered_data = filtered_data[filtered_data['almatv_speedtest'] == 1]
+    # Получаем статистику (из кэша, если такие фильтры уже запрашивались)
+    stats = cached_statistics(datasets.current, query)
     
-    # Получаем статистику
-    stats = get_statistics(filtered_data)
-    
-    return jsonify(stats)
+    with phase('jsonify'):
+        return jsonify(stats)
 
 # Маршрут для получения графиков
 @app.route('/get_charts')
 def get_charts():
-    # Получаем параметры фильтрации
-    provider = request.args.get('provider', 'all')
-    min_speed = float(request.args.get('min_speed', 0))
-    max_speed = float(request.args.get('max_speed', 500))
-    
-    # Фильтруем данные
-    filtered_data = df.copy()
+    # Получаем параметры фильтрации (тот же набор строк, что и на карте)
+    query = DataQuery.from_args(request.args, SPEED_DEFAULTS)
     
-    if provider != 'all':
-        if provider == 'kt':
-            filtered_data = filtered_data[filtered_data['kt_speedtest'] == 1]
-        elif provider == 'beeline':
-            filtered_data = filtered_data[filtered_data['beeline_speedtest'] == 1]
-        elif provider == 'almatv':
-            filtered_data = filtered_data[filtered_data['almatv_speedtest'] == 1]
+    # Получаем графики (из кэша, если такие фильтры уже запрашивались)
+    charts = cached_charts(datasets.current, query)
     
-    # Получаем статистику
-    stats = get_statistics(filtered_data)
-    
-    # Создаем графики
-    charts = create_charts(filtered_data, stats)
-    
-    return jsonify(charts)
+    with phase('jsonify'):
+        return jsonify(charts)
+
+# Метрики процесса в формате Prometheus
+@app.route('/metrics')
+def get_metrics():
+    return app.response_class(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# Проверка доступа к маршрутам /admin/: токен ADMIN_TOKEN должен
+# передаваться в заголовке X-Admin-Token; без ADMIN_TOKEN маршруты недоступны.
+# Возвращает ответ 403 или None
+def check_admin_token():
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return jsonify({'error': 'Доступ запрещен: не задан ADMIN_TOKEN'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    return None
+
+# Перезагрузка данных без перезапуска: отчет о времени и памяти
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    # Рабочий процесс не загружает данные сам, а передает SIGHUP главному процессу:
+    # тот загрузит новую версию (если файл изменился) и заменит рабочие процессы
+    if MULTIPROCESS:
+        if request.args.get('force') == '1':
+            return jsonify({'error': 'force=1 недоступен при нескольких рабочих процессах: '
+                                     'измените файл данных и отправьте SIGHUP главному процессу'}), 409
+        os.kill(os.getppid(), signal.SIGHUP)
+        return jsonify({'reloaded': False, 'scheduled': True, 'version': datasets.current.version}), 202
+    
+    report = datasets.reload(force=request.args.get('force') == '1')
+    if report is None:
+        return jsonify({'reloaded': False, 'version': datasets.current.version})
+    
+    return jsonify(dict(report, reloaded=True))
+
+# Информация о текущей версии данных и последней перезагрузке
+@app.route('/admin/dataset')
+def admin_dataset():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    ds = datasets.current
+    return jsonify({
+        'version': ds.version,
+        'rows': len(ds.data),
+        'loaded_at': ds.loaded_at,
+        'last_reload': datasets.last_reload
+    })
+
+# Выборочный профилировщик: POST ?enabled=1|0 включает и выключает его,
+# GET возвращает накопленные стеки в свернутом формате (flamegraph.pl, speedscope)
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'GET':
+        return app.response_class(profiler.collapsed(), mimetype='text/plain')
+    
+    enabled = request.args.get('enabled')
+    if enabled not in ('0', '1'):
+        raise QueryError(f"Некорректное значение enabled: {enabled}")
+    if enabled == '1':
+        # Период выборки в секундах, не меньше MIN_PROFILER_INTERVAL (по умолчанию - прежний)
+        interval = None
+        if request.args.get('interval'):
+            try:
+                interval = float(request.args['interval'])
+            except ValueError:
+                raise QueryError(f"Некорректный интервал: {request.args['interval']}")
+            if not interval >= MIN_PROFILER_INTERVAL:
+                raise QueryError(f"Интервал должен быть не меньше {MIN_PROFILER_INTERVAL} с: {request.args['interval']}")
+        profiler.start(interval)
+    else:
+        profiler.stop()
+    return jsonify(profiler.status())
+
+# Запуск профилировщика вместе с приложением (PROFILER=1)
+if os.environ.get('PROFILER') == '1':
+    profiler.start()
+
+# Прогрев кэша статистики при запуске (WARM_STATS_CACHE=1)
+if os.environ.get('WARM_STATS_CACHE') == '1' and not datasets.current.empty:
+    warm_stats_cache(datasets.current)
+
+# Фоновая проверка файла данных каждые DATA_WATCH_INTERVAL секунд (0 - отключено)
+DATA_WATCH_INTERVAL = float(os.environ.get('DATA_WATCH_INTERVAL', 0))
+if DATA_WATCH_INTERVAL > 0:
+    datasets.watch(DATA_WATCH_INTERVAL)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
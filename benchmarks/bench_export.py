@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# bench_export.py - Проверка, что потоковая выгрузка /export не растит память
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_export.py [--size 1000000] [--max-growth-mb 128] [--max-drift-mb 16]
+# На синтетическом наборе данных выгрузка каждого формата читается частями
+# через тестовый клиент Flask; после каждой части замеряется RSS процесса.
+# RSS колеблется в пределах рабочего набора одной части (аллокатор), поэтому
+# проверяются две величины: пиковый прирост относительно начала выгрузки
+# и дрейф - рост пика во второй половине выгрузки относительно первой.
+# При постоянной памяти дрейф близок к нулю независимо от размера выгрузки.
+# Перед замером проверяется, что выгрузка колонок object (строки, None,
+# смешанные значения, как в pandas 2.x) читается обратно без потерь.
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import app as app_module
+from dataset import Dataset, current_rss
+from export import EXPORT_FORMATS, export_stream, parquet_available
+from synthetic import make_speedtest_frame
+
+
+# Функция для чтения выгрузки частями: (байт, RSS после каждой части, секунд)
+def stream_export(client, export_format):
+    started = time.perf_counter()
+    response = client.get('/export', query_string={'format': export_format}, buffered=False)
+    if response.status_code != 200:
+        raise SystemExit(f"/export вернул {response.status_code}: {response.get_data(as_text=True)}")
+    size = 0
+    rss = []
+    try:
+        for chunk in response.response:
+            size += len(chunk)
+            rss.append(current_rss())
+    finally:
+        response.close()
+    return size, rss, time.perf_counter() - started
+
+
+# Проверка выгрузки колонок object: первая часть содержит только None,
+# следующие - строки и числа вперемешку
+def check_object_columns():
+    data = make_speedtest_frame(1000)
+    for column in ('address', 'isb_town', 'abonent_sub_house'):
+        data[column] = data[column].astype(object)
+        data.loc[:99, column] = None
+    data['mixed'] = pd.Series([None] * 100 + [i if i % 2 else f"д{i}" for i in range(900)], dtype=object)
+    rows = np.arange(len(data))
+
+    # Ожидаемые значения: строки, пропуски - None
+    expected = data[['address', 'isb_town', 'abonent_sub_house', 'mixed']].astype('string')
+    expected = expected.astype(object).where(expected.notna(), None)
+
+    for export_format in EXPORT_FORMATS:
+        if export_format == 'parquet' and not parquet_available():
+            continue
+        body = b''.join(export_stream(export_format, data, rows, 64))
+        if export_format == 'csv':
+            result = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, na_values=[''])
+        elif export_format == 'ndjson':
+            result = pd.read_json(io.BytesIO(body), lines=True, dtype=False)
+        else:
+            import pyarrow.parquet as pq
+            result = pq.read_table(io.BytesIO(body)).to_pandas()
+        if len(result) != len(data):
+            raise SystemExit(f"{export_format}: выгружено {len(result)} строк из {len(data)}")
+        for column in expected.columns:
+            values = result[column].astype('string')
+            values = values.astype(object).where(values.notna(), None)
+            if values.tolist() != expected[column].tolist():
+                raise SystemExit(f"{export_format}: значения колонки {column} изменились при выгрузке")
+    print("Колонки object выгружаются без потерь")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Память потоковой выгрузки /export')
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--max-growth-mb', type=float, default=128)
+    parser.add_argument('--max-drift-mb', type=float, default=16)
+    args = parser.parse_args()
+
+    check_object_columns()
+
+    app_module.app.debug = False
+    app_module.EXPORT_MAX_ROWS = 0
+    client = app_module.app.test_client()
+    app_module.datasets.swap(Dataset(make_speedtest_frame(args.size), f"synthetic-{args.size}", tile_cache_dir=None))
+
+    formats = [f for f in EXPORT_FORMATS if f != 'parquet' or parquet_available()]
+    failed = False
+    print(f"{'формат':>8} {'МиБ выгружено':>14} {'частей':>7} {'пик RSS, МиБ':>13} {'дрейф, МиБ':>11} {'с':>7}")
+    for export_format in formats:
+        # Первая выгрузка прогревает аллокатор и ленивые структуры, замер - по второй
+        stream_export(client, export_format)
+        baseline = current_rss()
+        size, rss, elapsed = stream_export(client, export_format)
+        half = len(rss) // 2
+        growth = (max(rss) - baseline) / 2 ** 20
+        drift = (max(rss[half:]) - max(rss[:half] or rss)) / 2 ** 20
+        failed |= growth > args.max_growth_mb or drift > args.max_drift_mb
+        print(f"{export_format:>8} {size / 2 ** 20:>14.1f} {len(rss):>7} {growth:>13.1f} {drift:>11.1f} {elapsed:>7.1f}")
+
+    if failed:
+        raise SystemExit(f"Память выгрузки не постоянна: пик > {args.max_growth_mb} МиБ "
+                         f"или дрейф > {args.max_drift_mb} МиБ")
+
+
+if __name__ == '__main__':
+    main()
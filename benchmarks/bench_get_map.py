@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# bench_get_map.py - Сравнение сериализации /get_map: iterrows против NumPy
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_get_map.py [--sizes 10000 100000 1000000]
+# Для каждого размера проверяется побайтное совпадение ответов.
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify
+
+import app as app_module
+from dataset import Dataset
+from synthetic import make_speedtest_frame
+
+SPEED_COLUMNS = {
+    'kt': ('kt_speedtest', 'kt_download_speed'),
+    'beeline': ('beeline_speedtest', 'beeline_download_speed'),
+    'almatv': ('almatv_speedtest', 'almatv_download_speed')
+}
+
+
+# Исходная реализация get_map() (фильтрация + iterrows), эталон для сравнения
+def legacy_get_map(df, provider, min_speed, max_speed, map_type):
+    filtered_data = df.copy()
+    filtered_data = filtered_data.dropna(subset=['latitude_speedtest', 'longitude_speedtest'])
+    if provider != 'all':
+        flag, speed_column = SPEED_COLUMNS[provider]
+        filtered_data = filtered_data[filtered_data[flag] == 1]
+    else:
+        filtered_data['max_download_speed'] = filtered_data[['kt_download_speed', 'beeline_download_speed', 'almatv_download_speed']].max(axis=1, skipna=True)
+        speed_column = 'max_download_speed'
+    filtered_data = filtered_data[(filtered_data[speed_column] >= min_speed) &
+                                  (filtered_data[speed_column] <= max_speed)]
+    if len(filtered_data) == 0:
+        return jsonify([])
+
+    points = []
+    if map_type == 'points':
+        for _, row in filtered_data.iterrows():
+            current_speed = row[speed_column]
+            if current_speed < 50:
+                color = 'red'
+            elif current_speed < 100:
+                color = 'orange'
+            else:
+                color = 'green'
+            points.append({
+                'lat': float(row['latitude_speedtest']),
+                'lng': float(row['longitude_speedtest']),
+                'speed': float(current_speed),
+                'color': color,
+                'providers': {
+                    'kt': bool(row['kt_speedtest'] == 1),
+                    'beeline': bool(row['beeline_speedtest'] == 1),
+                    'almatv': bool(row['almatv_speedtest'] == 1)
+                },
+                'address': row['address'] if 'address' in row else 'Точка интернета'
+            })
+    elif map_type.startswith('heatmap'):
+        for _, row in filtered_data.iterrows():
+            value = float(row[speed_column]) if map_type == 'heatmap_speed' else 1
+            points.append({
+                'lat': float(row['latitude_speedtest']),
+                'lng': float(row['longitude_speedtest']),
+                'value': value
+            })
+    return jsonify(points)
+
+
+def timed(func):
+    t = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сериализация /get_map: iterrows против NumPy')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--map-types', nargs='+', default=['points', 'heatmap_speed', 'heatmap_density'])
+    parser.add_argument('--provider', default='all')
+    args = parser.parse_args()
+
+    flask_app = app_module.app
+    flask_app.debug = False
+    client = flask_app.test_client()
+
+    print(f"{'строк':>9} {'режим':>16} {'iterrows, с':>12} {'numpy, с':>10} {'ускорение':>10} {'байт':>12}")
+    for size in args.sizes:
+        # Синтетический набор подменяет текущую версию данных вместе с индексами
+        data = make_speedtest_frame(size)
+        app_module.datasets.swap(Dataset(data, f"synthetic-{size}", tile_cache_dir=None))
+        query = {'provider': args.provider, 'min_speed': 0, 'max_speed': 500}
+        for map_type in args.map_types:
+            query['map_type'] = map_type
+            with flask_app.test_request_context('/get_map', query_string=query):
+                legacy_time, legacy = timed(lambda: legacy_get_map(data, args.provider, 0, 500, map_type))
+            new_time, response = timed(lambda: client.get('/get_map', query_string=query))
+
+            if legacy.get_data() != response.get_data():
+                raise SystemExit(f"Ответы различаются: {size} строк, режим {map_type}")
+            print(f"{size:>9} {map_type:>16} {legacy_time:>12.3f} {new_time:>10.3f} "
+                  f"{legacy_time / new_time:>9.1f}x {len(response.get_data()):>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# bench_import.py - Время импорта приложения по данным python -X importtime
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_import.py [--repeat 5] [--top 15]
+# Каждый замер выполняется в отдельном процессе. Загрузка данных не входит
+# в замер: модуль импортируется с несуществующим DATA_PATH. Для сравнения
+# измеряется импорт тяжелых библиотек графиков, которые приложение
+# больше не загружает.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'app': 'import app',
+    'folium + plotly': 'import folium, folium.plugins, plotly.express, plotly.graph_objects'
+}
+
+HEAVY_PACKAGES = ('plotly', 'folium', 'branca', 'matplotlib')
+
+
+# Функция для запуска импорта с -X importtime; возвращает {модуль: (собственное, суммарное) мкс}
+def import_times(code):
+    env = dict(os.environ, DATA_PATH=os.path.join(ROOT, 'data', 'missing.xlsx'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+# Суммарное время импорта: сумма собственных времен всех модулей (мкс)
+def total_time(times):
+    return sum(self_us for self_us, _ in times.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта приложения (-X importtime)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'цель':>16} {'медиана, мс':>12} {'мин, мс':>9} {'модулей':>8}")
+    runs = {}
+    for label, code in TARGETS.items():
+        runs[label] = [import_times(code) for _ in range(args.repeat)]
+        totals = [total_time(times) / 1000 for times in runs[label]]
+        print(f"{label:>16} {statistics.median(totals):>12.1f} {min(totals):>9.1f} {len(runs[label][0]):>8}")
+
+    times = runs['app'][-1]
+    heavy = sorted({name.split('.')[0] for name in times} & set(HEAVY_PACKAGES))
+    print(f"\nТяжелые пакеты, загружаемые приложением: {', '.join(heavy) if heavy else 'нет'}")
+
+    # Модули верхнего уровня с наибольшим суммарным временем
+    print("\nСамые дорогие пакеты при импорте app (суммарно, мс):")
+    packages = {}
+    for name, (_, cumulative_us) in times.items():
+        if '.' not in name:
+            packages[name] = cumulative_us
+    for name, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30} {cumulative_us / 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
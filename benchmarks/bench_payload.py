@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# bench_payload.py - Размер и время ответа /get_map в форматах json, columnar и binary
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_payload.py [--sizes 10000 100000 1000000]
+# Для каждого формата выводится размер без сжатия и со сжатием (gzip, br),
+# время ответа и проверяется, что повторный запрос с ETag получает 304.
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as app_module
+from dataset import Dataset
+from map_payload import PAYLOAD_FORMATS
+from responses import brotli
+from synthetic import make_speedtest_frame
+
+
+def timed(func):
+    t = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Форматы ответа /get_map: размер и время')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--map-types', nargs='+', default=['points', 'heatmap_speed'])
+    parser.add_argument('--provider', default='all')
+    args = parser.parse_args()
+
+    flask_app = app_module.app
+    flask_app.debug = False
+    client = flask_app.test_client()
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+
+    header = f"{'строк':>9} {'режим':>14} {'формат':>9}" + ''.join(f" {e + ', байт':>16}" for e in encodings)
+    print(header + f" {'время, с':>9}")
+    for size in args.sizes:
+        app_module.datasets.swap(Dataset(make_speedtest_frame(size), f"synthetic-{size}", tile_cache_dir=None))
+        for map_type in args.map_types:
+            for payload_format in PAYLOAD_FORMATS:
+                query = {'provider': args.provider, 'min_speed': 0, 'max_speed': 500,
+                         'map_type': map_type, 'format': payload_format}
+                sizes = []
+                for encoding in encodings:
+                    elapsed, response = timed(lambda: client.get('/get_map', query_string=query,
+                                                                 headers={'Accept-Encoding': encoding}))
+                    sizes.append(len(response.get_data()))
+                    if encoding == 'identity':
+                        identity_time = elapsed
+
+                # Повторный запрос с тем же ETag не обрабатывает данные
+                revalidated = client.get('/get_map', query_string=query,
+                                         headers={'If-None-Match': response.headers['ETag']})
+                if revalidated.status_code != 304:
+                    raise SystemExit(f"Ожидался ответ 304: {size} строк, {map_type}, {payload_format}")
+
+                print(f"{size:>9} {map_type:>14} {payload_format:>9}" +
+                      ''.join(f" {s:>16}" for s in sizes) + f" {identity_time:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# bench_routes.py - Замер всех маршрутов приложения на синтетических данных
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_routes.py [--sizes 10000 100000] [--distributions normal cities]
+#                                     [--repeats 7] [--output результат.json]
+#                                     [--compare benchmarks/results/базовый.json] [--threshold 0.25]
+# Для каждого размера и распределения (см. synthetic.py) синтетический набор
+# подменяет текущую версию данных, и каждый маршрут вызывается через тестовый
+# клиент Flask. Записываются время ответа (медиана, p95, минимум), пик
+# выделенной памяти (tracemalloc, отдельный прогон) и размер ответа.
+# Результаты сохраняются в JSON (по умолчанию в benchmarks/results/).
+# С --compare они сравниваются с прежним прогоном: рост минимального времени
+# (наименее зависит от фоновой нагрузки) или пика памяти больше чем на
+# threshold (и больше шумового порога) либо изменение размера ответа считается
+# регрессией, скрипт завершается с кодом 1.
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import app as app_module
+from dataset import Dataset
+from synthetic import CENTER, DISTRIBUTIONS, make_speedtest_frame
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Шумовые пороги: меньшие абсолютные изменения не считаются регрессией
+MIN_TIME_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KIB = 256
+
+# Сценарии, размер ответа которых зависит от предыдущих запросов
+VARIABLE_SIZE_CASES = {'metrics'}
+
+# Область вокруг центра Астаны (west, south, east, north)
+CITY_BBOX = f"{CENTER[1] - 0.05},{CENTER[0] - 0.03},{CENTER[1] + 0.05},{CENTER[0] + 0.03}"
+
+
+# Функция для получения номера тайла, содержащего точку (схема Web Mercator)
+def tile_for(lat, lng, z):
+    n = 1 << z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return z, x, y
+
+
+# Сценарии: имя, путь, параметры и сбрасывать ли кэш статистики перед вызовом
+def route_cases():
+    z, x, y = tile_for(CENTER[0], CENTER[1], 12)
+    return [
+        ('index', '/', {}, True),
+        ('analytics', '/analytics', {}, False),
+        ('get_map.points.json', '/get_map', {'map_type': 'points'}, False),
+        ('get_map.points.binary', '/get_map', {'map_type': 'points', 'format': 'binary'}, False),
+        ('get_map.heatmap_speed.columnar', '/get_map', {'map_type': 'heatmap_speed', 'format': 'columnar'}, False),
+        ('get_map.kt.bbox', '/get_map', {'provider': 'kt', 'min_speed': 50, 'bbox': CITY_BBOX}, False),
+        ('get_clusters.z8', '/get_clusters', {'zoom': 8}, False),
+        ('get_clusters.z13.bbox', '/get_clusters', {'zoom': 13, 'bbox': CITY_BBOX}, False),
+        ('get_rollup.city', '/get_rollup', {'level': 'city'}, False),
+        ('get_rollup.geohash6', '/get_rollup', {'level': 'geohash6'}, False),
+        ('tiles.density.z12', f'/tiles/{z}/{x}/{y}', {'layer': 'density'}, False),
+        ('tiles.speed.z12', f'/tiles/{z}/{x}/{y}', {'layer': 'speed'}, False),
+        ('get_stats.cold', '/get_stats', {'provider': 'beeline'}, True),
+        ('get_stats.warm', '/get_stats', {'provider': 'beeline'}, False),
+        ('get_charts.cold', '/get_charts', {'provider': 'kt'}, True),
+        ('get_charts.warm', '/get_charts', {'provider': 'kt'}, False),
+        ('export.csv', '/export', {'format': 'csv', 'limit': 100000}, False),
+        ('export.ndjson', '/export', {'format': 'ndjson', 'limit': 100000}, False),
+        ('metrics', '/metrics', {}, False)
+    ]
+
+
+# Функция для выполнения запроса: (секунд, код ответа, байт)
+def call(client, path, params, cold):
+    if cold:
+        app_module.stats_cache.clear()
+    started = time.perf_counter()
+    response = client.get(path, query_string=params)
+    try:
+        size = len(response.get_data())
+    finally:
+        # Потоковые ответы (/export) освобождают ресурсы при закрытии
+        response.close()
+    return time.perf_counter() - started, response.status_code, size
+
+
+# Функция для замера одного сценария
+def measure(client, path, params, cold, repeats):
+    # Прогрев: ленивые структуры, импорт модулей, кэш (для warm-сценариев)
+    call(client, path, params, cold)
+
+    timings = []
+    for _ in range(repeats):
+        elapsed, status, size = call(client, path, params, cold)
+        timings.append(elapsed * 1000)
+
+    # Пик памяти - в отдельном прогоне: tracemalloc замедляет выполнение
+    tracemalloc.start()
+    try:
+        call(client, path, params, cold)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = np.array(timings)
+    return {
+        'status': status,
+        'bytes': size,
+        'median_ms': round(float(np.median(timings)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'min_ms': round(float(timings.min()), 3),
+        'peak_kib': round(peak / 1024, 1)
+    }
+
+
+# Сведения о прогоне для сопоставления результатов
+def run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'sizes': args.sizes,
+        'distributions': args.distributions,
+        'seed': args.seed,
+        'repeats': args.repeats
+    }
+
+
+# Функция для сравнения с прежним прогоном; возвращает список регрессий
+def compare(results, baseline, threshold):
+    previous = {(r['size'], r['distribution'], r['case']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nСравнение с {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')}):")
+    print(f"{'строк':>9} {'распределение':>13} {'сценарий':<32} {'мин. мс было':>13} {'стало':>9} {'x':>6} "
+          f"{'память x':>9}")
+    for r in results:
+        key = (r['size'], r['distribution'], r['case'])
+        old = previous.get(key)
+        if old is None:
+            continue
+        time_ratio = r['min_ms'] / old['min_ms'] if old['min_ms'] else float('inf')
+        memory_ratio = r['peak_kib'] / old['peak_kib'] if old['peak_kib'] else float('inf')
+
+        problems = []
+        if time_ratio > 1 + threshold and r['min_ms'] - old['min_ms'] > MIN_TIME_DELTA_MS:
+            problems.append('время')
+        if memory_ratio > 1 + threshold and r['peak_kib'] - old['peak_kib'] > MIN_MEMORY_DELTA_KIB:
+            problems.append('память')
+        if r['bytes'] != old['bytes'] and key[2] not in VARIABLE_SIZE_CASES:
+            problems.append(f"размер {old['bytes']} -> {r['bytes']}")
+        if r['status'] != old['status']:
+            problems.append(f"код {old['status']} -> {r['status']}")
+        if problems:
+            regressions.append((key, problems))
+
+        mark = '  <- ' + ', '.join(problems) if problems else ''
+        print(f"{key[0]:>9} {key[1]:>13} {key[2]:<32} {old['min_ms']:>13.2f} {r['min_ms']:>9.2f} "
+              f"{time_ratio:>6.2f} {memory_ratio:>9.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время, память и размер ответа всех маршрутов')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--distributions', nargs='+', default=['normal', 'cities'], choices=DISTRIBUTIONS)
+    parser.add_argument('--cases', nargs='+', help='Только сценарии с этими префиксами имени')
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл результатов (по умолчанию benchmarks/results/<время>-<коммит>.json)')
+    parser.add_argument('--compare', help='Файл результатов прежнего прогона')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Допустимый относительный рост')
+    args = parser.parse_args()
+
+    app_module.app.debug = False
+    app_module.EXPORT_MAX_ROWS = 0
+    client = app_module.app.test_client()
+    cases = [case for case in route_cases()
+             if not args.cases or any(case[0].startswith(prefix) for prefix in args.cases)]
+
+    meta = run_metadata(args)
+    results = []
+    print(f"{'строк':>9} {'распределение':>13} {'сценарий':<32} {'медиана, мс':>12} {'p95, мс':>9} "
+          f"{'пик, КиБ':>10} {'байт':>11}")
+    for size in args.sizes:
+        for distribution in args.distributions:
+            # Синтетический набор подменяет текущую версию данных вместе с индексами
+            data = make_speedtest_frame(size, seed=args.seed, distribution=distribution)
+            app_module.datasets.swap(Dataset(data, f"synthetic-{distribution}-{size}", tile_cache_dir=None))
+            for name, path, params, cold in cases:
+                result = measure(client, path, params, cold, args.repeats)
+                if result['status'] != 200:
+                    print(f"Предупреждение: {name} вернул {result['status']}")
+                results.append(dict(result, size=size, distribution=distribution, case=name))
+                print(f"{size:>9} {distribution:>13} {name:<32} {result['median_ms']:>12.2f} "
+                      f"{result['p95_ms']:>9.2f} {result['peak_kib']:>10.1f} {result['bytes']:>11}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{meta['commit'] or 'nogit'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=1)
+    print(f"\nРезультаты сохранены: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            raise SystemExit(f"Регрессий: {len(regressions)}")
+        print("Регрессий нет")
+
+
+if __name__ == '__main__':
+    main()
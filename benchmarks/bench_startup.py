@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# bench_startup.py - Сравнение времени загрузки данных: xlsx против снимка
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_startup.py [путь к xlsx] [--repeat N]
+# Каждое измерение выполняется в отдельном процессе, как при старте воркера.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код, выполняемый в дочернем процессе: печатает время загрузки в секундах
+LOADERS = {
+    'xlsx': (
+        "import time, pandas as pd\n"
+        "t = time.perf_counter(); d = pd.read_excel({source!r})\n"
+        "print(time.perf_counter() - t, len(d))\n"
+    ),
+    'snapshot': (
+        "import time, snapshot\n"
+        "t = time.perf_counter(); d = snapshot.load_dataset({source!r}, {snapshot_dir!r})\n"
+        "print(time.perf_counter() - t, len(d))\n"
+    ),
+}
+
+
+def run_loader(name, source, snapshot_dir):
+    code = LOADERS[name].format(source=source, snapshot_dir=snapshot_dir)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, text=True)
+    seconds, rows = out.split()[-2:]
+    return float(seconds), int(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время загрузки данных: xlsx против снимка')
+    parser.add_argument('source', nargs='?', default=os.path.join(ROOT, 'data', 'cbm_st_pro_1.xlsx'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import snapshot
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        # Первичная сборка снимка (выполняется один раз на версию файла)
+        t = time.perf_counter()
+        snapshot.ensure_snapshot(args.source, snapshot_dir)
+        build = time.perf_counter() - t
+        print(f"Сборка снимка: {build:.3f} с")
+
+        results = {}
+        for name in LOADERS:
+            timings = []
+            for _ in range(args.repeat):
+                seconds, rows = run_loader(name, args.source, snapshot_dir)
+                timings.append(seconds)
+            results[name] = statistics.median(timings)
+            print(f"{name:>9}: медиана {results[name]:.4f} с, мин {min(timings):.4f} с ({rows} строк)")
+
+    print(f"Ускорение старта: x{results['xlsx'] / results['snapshot']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
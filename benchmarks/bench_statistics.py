@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# bench_statistics.py - Стоимость get_statistics() относительно одного прохода по данным
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_statistics.py [--sizes 100000 1000000]
+# Сравниваются: исходная реализация (фильтрованные копии на каждого провайдера),
+# агрегация за один проход и базовый "один проход" - чтение каждой нужной колонки.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aggregations import get_statistics
+from data_index import PROVIDERS
+from synthetic import make_speedtest_frame
+
+
+# Исходная реализация get_statistics() (без перцентилей и разбивки по городам)
+def legacy_get_statistics(data):
+    data = data.dropna(subset=['latitude_speedtest', 'longitude_speedtest'])
+    stats = {'total_points': len(data), 'providers': {}}
+    for name in PROVIDERS:
+        flag = f"{name}_speedtest"
+        stats['providers'][name] = {
+            'count': int(data[flag].sum()),
+            'avg_download': float(data[data[flag] == 1][f"{name}_download_speed"].mean()) if data[data[flag] == 1].shape[0] > 0 else 0,
+            'avg_upload': float(data[data[flag] == 1][f"{name}_upload_speed"].mean()) if data[data[flag] == 1].shape[0] > 0 else 0
+        }
+    stats['cities'] = data.groupby('isb_town').size().to_dict()
+    return stats
+
+
+# Базовая линия: один проход по каждой колонке, нужной статистике
+def one_scan(data):
+    columns = ['latitude_speedtest', 'longitude_speedtest']
+    for name in PROVIDERS:
+        columns += [f"{name}_speedtest", f"{name}_download_speed", f"{name}_upload_speed"]
+    total = sum(float(np.nansum(data[column].to_numpy(dtype=float))) for column in columns)
+    return total, data['isb_town'].nunique()
+
+
+def best_of(func, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - t)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стоимость get_statistics() относительно одного прохода')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'строк':>9} {'один проход, с':>15} {'исходная, с':>12} {'новая, с':>10} {'новая/проход':>13}")
+    for size in args.sizes:
+        data = make_speedtest_frame(size)
+        scan = best_of(one_scan, data, args.repeat)
+        legacy = best_of(legacy_get_statistics, data, args.repeat)
+        new = best_of(get_statistics, data, args.repeat)
+        print(f"{size:>9} {scan:>15.4f} {legacy:>12.4f} {new:>10.4f} {new / scan:>12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
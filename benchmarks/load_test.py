@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# load_test.py - Нагрузочный тест serve.py: запросы в секунду и p99 задержки
+#
+# Запуск из корня проекта:
+#   python benchmarks/load_test.py [--workers 1 2 4] [--duration 10] [--concurrency 16]
+#   python benchmarks/load_test.py --synthetic 200000   # синтетические данные
+# Для каждого числа рабочих процессов запускается serve.py, после чего каждый
+# маршрут нагружается concurrency параллельными клиентами asyncio в течение
+# duration секунд. Дополнительно выводится суммарная PSS рабочих процессов:
+# при общих страницах она растет медленнее числа процессов.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    'get_map': '/get_map?provider=all&min_speed=0&max_speed=500&map_type=points',
+    'get_stats': '/get_stats?provider=kt&min_speed=0&max_speed=500',
+    'get_charts': '/get_charts?provider=kt&min_speed=0&max_speed=500'
+}
+
+
+# Один HTTP-запрос по отдельному соединению; возвращает (код ответа, задержка в секундах)
+async def fetch(host, port, path):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: gzip\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, time.perf_counter() - started
+
+
+# Нагрузка одного маршрута: concurrency клиентов, каждый отправляет запросы подряд
+async def load(host, port, path, duration, concurrency):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            try:
+                status, latency = await fetch(host, port, path)
+            except OSError:
+                errors += 1
+                continue
+            if status == 200:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - started
+
+
+# Суммарная PSS (пропорциональная доля общих страниц) процессов, байт
+def total_pss(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            return None
+    return total
+
+
+# Рабочие процессы сервера (дочерние процессы serve.py)
+def worker_pids(parent_pid):
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+# Функция для ожидания готовности сервера
+def wait_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Сервер на порту {port} не запустился")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест serve.py')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument('--synthetic', type=int, default=0, help='число строк синтетических данных (0 - реальные данные)')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    tmp_dir = None
+    if args.synthetic:
+        from synthetic import make_speedtest_frame
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        data_path = os.path.join(tmp_dir.name, f"synthetic_{args.synthetic}.csv")
+        make_speedtest_frame(args.synthetic).to_csv(data_path, index=False)
+        env['DATA_PATH'] = data_path
+        env['SNAPSHOT_DIR'] = os.path.join(tmp_dir.name, 'snapshot')
+
+    print(f"{'процессов':>9} {'маршрут':>11} {'запросов/с':>11} {'p50, мс':>9} {'p99, мс':>9} {'ошибок':>7} {'PSS, МиБ':>9}")
+    for workers in args.workers:
+        server = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--host', '127.0.0.1',
+                                   '--port', str(args.port)], cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(args.port)
+            for name in args.endpoints:
+                latencies, errors, elapsed = asyncio.run(
+                    load('127.0.0.1', args.port, ENDPOINTS[name], args.duration, args.concurrency))
+                pss = total_pss(worker_pids(server.pid))
+                pss = f"{pss / 2 ** 20:>9.1f}" if pss is not None else f"{'-':>9}"
+                if len(latencies):
+                    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+                else:
+                    p50 = p99 = float('nan')
+                print(f"{workers:>9} {name:>11} {len(latencies) / elapsed:>11.1f} {p50:>9.1f} {p99:>9.1f} "
+                      f"{errors:>7} {pss}")
+        finally:
+            server.terminate()
+            server.wait()
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# synthetic.py - Генератор синтетических наборов данных спидтестов
+#
+# Кадры имеют ту же схему, что и data/cbm_st_pro_1.xlsx: флаги провайдеров
+# равны 1.0 или NaN, скорости заданы только для отмеченных провайдеров.
+# Пространственное распределение точек задается параметром distribution:
+#   normal   - одно облако вокруг центра Астаны (как в реальных данных)
+#   uniform  - равномерно по территории Казахстана, город - ближайший к точке
+#   cities   - облака вокруг крупных городов с весами по численности населения
+#   hotspots - плотные скопления (многоквартирные дома) в пределах Астаны;
+#              много точек с одинаковыми координатами
+import numpy as np
+import pandas as pd
+
+PROVIDERS = ['kt', 'beeline', 'almatv']
+
+# Доля точек с замером провайдера и медианная скорость загрузки (как в реальных данных)
+PROVIDER_PROFILE = {
+    'kt': (0.96, 140.0),
+    'beeline': (0.73, 65.0),
+    'almatv': (0.35, 43.0)
+}
+
+# Центр Астаны
+CENTER = (51.1605, 71.4704)
+
+# Крупные города: название, центр и относительная численность населения
+CITIES = [
+    ('АСТАНА', 51.1605, 71.4704, 1.35),
+    ('АЛМАТЫ', 43.2389, 76.8897, 2.2),
+    ('ШЫМКЕНТ', 42.3417, 69.5901, 1.2),
+    ('КАРАГАНДА', 49.8047, 73.1094, 0.5),
+    ('АКТОБЕ', 50.2839, 57.1670, 0.5),
+    ('ПАВЛОДАР', 52.2873, 76.9674, 0.35),
+    ('УСТЬ-КАМЕНОГОРСК', 49.9482, 82.6279, 0.33),
+    ('АТЫРАУ', 47.0945, 51.9238, 0.3)
+]
+
+# Границы территории для равномерного распределения: west, south, east, north
+KAZAKHSTAN_BOUNDS = (46.5, 40.6, 87.3, 55.4)
+
+DISTRIBUTIONS = ('normal', 'uniform', 'cities', 'hotspots')
+
+STREETS = ['ДЖАНГИЛЬДИНА', 'ЖЕЛТОКСАН', 'КЕНЕСАРЫ', 'АБАЯ', 'РЕСПУБЛИКИ', 'БЕЙБИТШИЛИК']
+
+
+# Равномерно по территории; город - ближайший из CITIES
+def uniform_locations(rng, n):
+    west, south, east, north = KAZAKHSTAN_BOUNDS
+    lat = rng.uniform(south, north, n)
+    lng = rng.uniform(west, east, n)
+    centers = np.array([(c_lat, c_lng) for _, c_lat, c_lng, _ in CITIES])
+    nearest = np.zeros(n, dtype=np.intp)
+    best = np.full(n, np.inf)
+    for i, (c_lat, c_lng) in enumerate(centers):
+        distance = (lat - c_lat) ** 2 + ((lng - c_lng) * np.cos(np.radians(c_lat))) ** 2
+        closer = distance < best
+        nearest[closer] = i
+        best[closer] = distance[closer]
+    names = np.asarray([name for name, _, _, _ in CITIES], dtype=object)
+    return lat, lng, names[nearest]
+
+
+# Облака вокруг городов, размер облака растет с численностью населения
+def city_locations(rng, n):
+    weights = np.array([population for _, _, _, population in CITIES])
+    city = rng.choice(len(CITIES), n, p=weights / weights.sum())
+    centers = np.array([(c_lat, c_lng, population) for _, c_lat, c_lng, population in CITIES])
+    spread = 0.02 + 0.02 * centers[city, 2]
+    lat = centers[city, 0] + rng.normal(0, 1, n) * spread
+    lng = centers[city, 1] + rng.normal(0, 1, n) * spread * 1.6
+    names = np.asarray([name for name, _, _, _ in CITIES], dtype=object)
+    return lat, lng, names[city]
+
+
+# Плотные скопления: центры домов вокруг Астаны, число точек в доме убывает по закону Ципфа
+def hotspot_locations(rng, n):
+    spots = max(1, n // 200)
+    spot_lat = CENTER[0] + rng.normal(0, 0.03, spots)
+    spot_lng = CENTER[1] + rng.normal(0, 0.05, spots)
+    weights = 1.0 / np.arange(1, spots + 1)
+    spot = rng.choice(spots, n, p=weights / weights.sum())
+    lat = spot_lat[spot] + rng.normal(0, 0.0004, n)
+    lng = spot_lng[spot] + rng.normal(0, 0.0006, n)
+    return lat, lng, np.full(n, 'АСТАНА', dtype=object)
+
+
+LOCATIONS = {
+    'uniform': uniform_locations,
+    'cities': city_locations,
+    'hotspots': hotspot_locations
+}
+
+
+# Функция для генерации кадра из n строк
+def make_speedtest_frame(n, seed=0, missing_coords=0.025, towns=('АСТАНА', 'Астана'), distribution='normal'):
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Неизвестное распределение: {distribution}")
+    rng = np.random.default_rng(seed)
+
+    town = np.asarray(towns, dtype=object)[rng.integers(0, len(towns), n)]
+    street = np.asarray(STREETS, dtype=object)[rng.integers(0, len(STREETS), n)]
+    house = rng.integers(1, 200, n).astype(float)
+
+    # Для normal порядок выборок совпадает с прежним: при том же seed данные те же
+    if distribution == 'normal':
+        lat = CENTER[0] + rng.normal(0, 0.025, n)
+        lng = CENTER[1] + rng.normal(0, 0.04, n)
+    else:
+        lat, lng, town = LOCATIONS[distribution](rng, n)
+    address = [f"{t.upper()},{s},{int(h)}" for t, s, h in zip(town, street, house)]
+
+    lat = np.round(lat, 3)
+    lng = np.round(lng, 3)
+    missing = rng.random(n) < missing_coords
+    lat[missing] = np.nan
+    lng[missing] = np.nan
+
+    data = {
+        'address': address,
+        'isb_town': town,
+        'isb_street': street,
+        'abonent_house': house,
+        'abonent_sub_house': np.where(rng.random(n) < 0.45, 'А', None),
+        'latitude_speedtest': lat,
+        'longitude_speedtest': lng
+    }
+
+    flags = {}
+    for provider in PROVIDERS:
+        share, _ = PROVIDER_PROFILE[provider]
+        flags[provider] = rng.random(n) < share
+        data[f"{provider}_speedtest"] = np.where(flags[provider], 1.0, np.nan)
+
+    for provider in PROVIDERS:
+        _, median = PROVIDER_PROFILE[provider]
+        download = rng.lognormal(np.log(median), 0.5, n)
+        upload = download * rng.uniform(0.6, 1.2, n)
+        data[f"{provider}_download_speed"] = np.where(flags[provider], download, np.nan)
+        data[f"{provider}_upload_speed"] = np.where(flags[provider], upload, np.nan)
+
+    return pd.DataFrame(data)
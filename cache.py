@@ -0,0 +1,67 @@
+# cache.py - Ограниченный LRU-кэш с временем жизни записей
+#
+# Используется для статистики и графиков: данные между перезагрузками
+# статичны, поэтому результат зависит только от версии данных и фильтров.
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        # Время жизни записи в секундах (None - без ограничения)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Функция для получения значения из кэша или его вычисления
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            # Вычисление выполняется вне блокировки: параллельные промахи
+            # по одному ключу посчитают значение дважды, но не заблокируют кэш
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Сводка по кэшу: размер и счетчики попаданий/промахов
+    def info(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,191 @@
+# chart_specs.py - Графики аналитики в виде JSON-спецификаций Plotly
+#
+# Графики собираются напрямую как словари {"data": [...], "layout": {...}},
+# которые Plotly.newPlot принимает в браузере, без импорта plotly в Python:
+# процессы, обслуживающие только карту и данные, не загружают plotly.
+# Оформление повторяет стандартный шаблон plotly (TEMPLATE), значения
+# передаются обычными JSON-массивами.
+import json
+
+import numpy as np
+
+from data_index import LAT_COLUMN, LNG_COLUMN, PROVIDERS
+
+# Подписи и цвета провайдеров
+PROVIDER_LABELS = {'kt': 'Казахтелеком', 'beeline': 'Beeline', 'almatv': 'AlmaTV'}
+DOWNLOAD_COLORS = {'kt': '#0056A4', 'beeline': '#FFCC00', 'almatv': '#FF6600'}
+UPLOAD_COLORS = {'kt': '#4D94DB', 'beeline': '#FFE066', 'almatv': '#FF9966'}
+
+# Количество интервалов гистограмм скорости
+HISTOGRAM_BINS = 20
+
+# Количество городов на графике
+TOP_CITIES = 10
+
+# Основные параметры стандартного шаблона plotly
+_AXIS = {
+    'automargin': True,
+    'gridcolor': 'white',
+    'linecolor': 'white',
+    'ticks': '',
+    'title': {'standoff': 15},
+    'zerolinecolor': 'white',
+    'zerolinewidth': 2
+}
+_PATTERN = {'fillmode': 'overlay', 'size': 10, 'solidity': 0.2}
+TEMPLATE = {
+    'data': {
+        'bar': [{'error_x': {'color': '#2a3f5f'}, 'error_y': {'color': '#2a3f5f'},
+                 'marker': {'line': {'color': '#E5ECF6', 'width': 0.5}, 'pattern': _PATTERN}, 'type': 'bar'}],
+        'histogram': [{'marker': {'pattern': _PATTERN}, 'type': 'histogram'}],
+        'pie': [{'automargin': True, 'type': 'pie'}]
+    },
+    'layout': {
+        'autotypenumbers': 'strict',
+        'colorway': ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A',
+                     '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'],
+        'font': {'color': '#2a3f5f'},
+        'hoverlabel': {'align': 'left'},
+        'hovermode': 'closest',
+        'paper_bgcolor': 'white',
+        'plot_bgcolor': '#E5ECF6',
+        'title': {'x': 0.05},
+        'xaxis': _AXIS,
+        'yaxis': _AXIS
+    }
+}
+
+
+# Функция для замены NaN и бесконечностей на None (как PlotlyJSONEncoder):
+# JSON.parse в браузере не принимает токен NaN
+def _finite(value):
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+# Функция для сериализации графика в JSON (строка, как у Figure.to_json)
+def figure_json(data, layout):
+    return json.dumps(_finite({'data': data, 'layout': dict(layout, template=TEMPLATE)}), allow_nan=False)
+
+
+# Функция для создания пустого графика с сообщением
+def empty_figure(title, message):
+    return figure_json([], {
+        'title': {'text': title},
+        'annotations': [{'text': message, 'showarrow': False, 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5}]
+    })
+
+
+# Оси графика с подписями (как у plotly.express)
+def _axes_layout(title, x_title, y_title):
+    return {
+        'title': {'text': title},
+        'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_title}},
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_title}},
+        'legend': {'tracegroupgap': 0},
+        'barmode': 'relative'
+    }
+
+
+# Гистограмма значений (интервалы строит Plotly в браузере, как px.histogram)
+def histogram_figure(values, title, color, x_title):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    trace = {
+        'type': 'histogram',
+        'x': values.tolist(),
+        'nbinsx': HISTOGRAM_BINS,
+        'bingroup': 'x',
+        'marker': {'color': color},
+        'name': '',
+        'orientation': 'v',
+        'showlegend': False,
+        'hovertemplate': f"{x_title}=%{{x}}<br>count=%{{y}}<extra></extra>"
+    }
+    return figure_json([trace], _axes_layout(title, x_title, 'count'))
+
+
+# Столбчатая диаграмма одной серии
+def bar_figure(x, y, title, color, x_title, y_title):
+    trace = {
+        'type': 'bar',
+        'x': list(x),
+        'y': list(y),
+        'marker': {'color': color},
+        'name': '',
+        'orientation': 'v',
+        'showlegend': False,
+        'textposition': 'auto',
+        'hovertemplate': f"{x_title}=%{{x}}<br>{y_title}=%{{y}}<extra></extra>"
+    }
+    return figure_json([trace], _axes_layout(title, x_title, y_title))
+
+
+# Функция для создания графиков
+def create_charts(data, stats):
+    if data.empty:
+        # Создаем пустые графики с сообщением об отсутствии данных
+        empty_message = "Нет данных для отображения"
+        charts = {
+            f"{name}_hist": empty_figure(f"Распределение скорости {PROVIDER_LABELS[name]}", empty_message)
+            for name in PROVIDERS
+        }
+        charts['providers_comparison'] = empty_figure('Сравнение средних скоростей провайдеров', empty_message)
+        charts['providers_pie'] = empty_figure('Доля провайдеров по количеству точек', empty_message)
+        charts['cities_bar'] = empty_figure('Топ-10 городов по количеству точек', empty_message)
+        return charts
+
+    charts = {}
+    providers = stats['providers']
+    labels = [PROVIDER_LABELS[name] for name in PROVIDERS]
+
+    # 1. Гистограммы распределения скорости для каждого провайдера (строки с координатами)
+    valid = ~(data[LAT_COLUMN].isna().to_numpy() | data[LNG_COLUMN].isna().to_numpy())
+    for name in PROVIDERS:
+        title = f"Распределение скорости {PROVIDER_LABELS[name]}"
+        rows = valid & (data[f"{name}_speedtest"].to_numpy(dtype=float) == 1)
+        if rows.any():
+            charts[f"{name}_hist"] = histogram_figure(data[f"{name}_download_speed"].to_numpy(dtype=float)[rows],
+                                                      title, DOWNLOAD_COLORS[name], 'Скорость (Мбит/с)')
+        else:
+            charts[f"{name}_hist"] = empty_figure(title, f"Нет данных для {PROVIDER_LABELS[name]}")
+
+    # 2. Сравнение средних скоростей провайдеров
+    charts['providers_comparison'] = figure_json([
+        {'type': 'bar', 'name': 'Скорость загрузки', 'x': labels,
+         'y': [providers[name]['avg_download'] for name in PROVIDERS],
+         'marker': {'color': [DOWNLOAD_COLORS[name] for name in PROVIDERS]}},
+        {'type': 'bar', 'name': 'Скорость выгрузки', 'x': labels,
+         'y': [providers[name]['avg_upload'] for name in PROVIDERS],
+         'marker': {'color': [UPLOAD_COLORS[name] for name in PROVIDERS]}}
+    ], {
+        'title': {'text': 'Сравнение средних скоростей провайдеров'},
+        'xaxis': {'title': {'text': 'Провайдер'}},
+        'yaxis': {'title': {'text': 'Скорость (Мбит/с)'}},
+        'barmode': 'group'
+    })
+
+    # 3. Круговая диаграмма доли провайдеров
+    charts['providers_pie'] = figure_json([{
+        'type': 'pie',
+        'labels': labels,
+        'values': [providers[name]['count'] for name in PROVIDERS],
+        'marker': {'colors': [DOWNLOAD_COLORS[name] for name in PROVIDERS]},
+        'hole': 0.3
+    }], {'title': {'text': 'Доля провайдеров по количеству точек'}})
+
+    # 4. Топ-10 городов по количеству точек (порядок при равенстве - как в stats)
+    if stats.get('cities'):
+        top = sorted(stats['cities'].items(), key=lambda item: -item[1])[:TOP_CITIES]
+        charts['cities_bar'] = bar_figure([city for city, _ in top], [count for _, count in top],
+                                          'Топ-10 городов по количеству точек', DOWNLOAD_COLORS['kt'],
+                                          'Город', 'Количество точек')
+    else:
+        charts['cities_bar'] = empty_figure('Топ-10 городов по количеству точек', "Нет данных о городах")
+
+    return charts
@@ -0,0 +1,243 @@
+# clustering.py - Серверная кластеризация точек по области просмотра и масштабу
+#
+# Точки проецируются в Web Mercator и группируются по сетке: на масштабе z
+# ячейка имеет размер CLUSTER_RADIUS пикселей. Для обзорных масштабов
+# (до PRECOMPUTED_MAX_ZOOM) таблицы кластеров строятся при загрузке данных
+# для каждого провайдера, а номер ячейки каждой точки сохраняется: при фильтре
+# по скорости кластеры считаются подсчетом (bincount) по отобранным точкам без
+# сортировки. На крупных масштабах кластеры считаются на лету только по точкам
+# в области просмотра.
+# Область просмотра (bbox) отбирает ячейки сетки, которые она пересекает, и
+# кластер включает все точки ячейки, в том числе за границей области: так
+# заранее построенные таблицы и расчет на лету дают одинаковые кластеры.
+# Начиная с LEAF_ZOOM точки возвращаются по отдельности.
+import json
+
+import numpy as np
+
+from data_index import PROVIDERS
+from map_payload import points_json
+
+TILE_SIZE = 256
+
+# Размер ячейки кластеризации в пикселях экрана
+CLUSTER_RADIUS = 60
+
+# Масштабы, для которых кластеры вычисляются заранее
+PRECOMPUTED_MAX_ZOOM = 10
+
+# Начиная с этого масштаба кластеризация не выполняется
+LEAF_ZOOM = 17
+MAX_ZOOM = 20
+
+# Ограничение широты проекции Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+# Функция для проекции координат в Web Mercator (диапазон [0, 1])
+def mercator(lat, lng):
+    x = (np.asarray(lng, dtype=float) + 180.0) / 360.0
+    siny = np.sin(np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)))
+    y = 0.5 - np.log((1 + siny) / (1 - siny)) / (4 * np.pi)
+    return np.clip(x, 0.0, 1.0), np.clip(y, 0.0, 1.0)
+
+
+# Количество ячеек сетки по одной оси на масштабе zoom
+def grid_size(zoom):
+    return int(np.ceil(TILE_SIZE * (1 << zoom) / CLUSTER_RADIUS))
+
+
+# Функция для приведения масштаба к допустимому диапазону
+def clamp_zoom(zoom):
+    return int(min(max(zoom, 0), MAX_ZOOM))
+
+
+# Пустая таблица кластеров
+def empty_table():
+    empty = np.empty(0)
+    return ClusterTable(empty.astype(np.int64), empty, empty, empty, empty,
+                        {name: empty.astype(np.int64) for name in PROVIDERS},
+                        empty.astype(np.intp), empty.astype(np.int64))
+
+
+# Класс таблицы кластеров: по одной записи на непустую ячейку сетки
+class ClusterTable:
+    def __init__(self, count, lat, lng, speed_sum, speed_min, providers, first, key):
+        self.count = count
+        self.lat = lat
+        self.lng = lng
+        self.speed_sum = speed_sum
+        self.speed_min = speed_min
+        self.providers = providers
+        # Позиция одной из точек ячейки (для ячеек из одной точки)
+        self.first = first
+        # Ключ ячейки сетки: iy * grid_size(zoom) + ix
+        self.key = key
+
+    def take(self, mask):
+        return ClusterTable(self.count[mask], self.lat[mask], self.lng[mask],
+                            self.speed_sum[mask], self.speed_min[mask],
+                            {name: counts[mask] for name, counts in self.providers.items()},
+                            self.first[mask], self.key[mask])
+
+
+class ClusterIndex:
+    def __init__(self, data_index):
+        self.index = data_index
+        self.x, self.y = mercator(data_index.lat, data_index.lng)
+
+        # Номера непустых ячеек обзорных масштабов для каждой точки (в порядке
+        # ключей сетки, как в aggregate) и ключи этих ячеек
+        self.cells = []
+        for zoom in range(PRECOMPUTED_MAX_ZOOM + 1):
+            keys, inverse = np.unique(self.cell_keys(np.arange(len(self.x)), zoom), return_inverse=True)
+            self.cells.append((inverse.astype(np.min_scalar_type(max(len(keys) - 1, 0))), keys))
+
+        # Предварительно агрегированные таблицы обзорных масштабов для каждого провайдера
+        self.tables = {}
+        for key, order in data_index.orders.items():
+            positions = np.sort(order)
+            self.tables[key] = [self.aggregate_precomputed(positions, key, zoom)
+                                for zoom in range(PRECOMPUTED_MAX_ZOOM + 1)]
+
+    # Ключи ячеек сетки для точек (позиций индекса)
+    def cell_keys(self, positions, zoom):
+        cells = grid_size(zoom)
+        ix = np.minimum((self.x[positions] * cells).astype(np.int64), cells - 1)
+        iy = np.minimum((self.y[positions] * cells).astype(np.int64), cells - 1)
+        return iy * cells + ix
+
+    # Диапазон ячеек сетки, которые пересекает bbox: (ix0, iy0, ix1, iy1) включительно
+    @staticmethod
+    def cell_range(bbox, zoom):
+        west, south, east, north = bbox
+        cells = grid_size(zoom)
+        x0, y0 = mercator(north, west)
+        x1, y1 = mercator(south, east)
+        return (min(int(x0 * cells), cells - 1), min(int(y0 * cells), cells - 1),
+                min(int(x1 * cells), cells - 1), min(int(y1 * cells), cells - 1))
+
+    # Маска ключей ячеек, попадающих в диапазон cell_range
+    @staticmethod
+    def keys_in_range(keys, cell_range, zoom):
+        ix0, iy0, ix1, iy1 = cell_range
+        cells = grid_size(zoom)
+        ix = keys % cells
+        iy = keys // cells
+        return (ix >= ix0) & (ix <= ix1) & (iy >= iy0) & (iy <= iy1)
+
+    # Функция для группировки точек (позиций индекса) по ячейкам сетки
+    def aggregate(self, positions, provider, zoom):
+        keys, inverse = np.unique(self.cell_keys(positions, zoom), return_inverse=True)
+        if len(keys) == 0:
+            return empty_table()
+
+        speed = self.index.speed[provider][positions]
+        count = np.bincount(inverse)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+
+        return ClusterTable(
+            count=count,
+            lat=np.bincount(inverse, weights=self.index.lat[positions]) / count,
+            lng=np.bincount(inverse, weights=self.index.lng[positions]) / count,
+            speed_sum=np.bincount(inverse, weights=speed),
+            speed_min=np.minimum.reduceat(speed[order], starts),
+            providers={name: np.bincount(inverse, weights=self.index.flags[name][positions]).astype(np.int64)
+                       for name in PROVIDERS},
+            first=positions[order[starts]],
+            key=keys
+        )
+
+    # Функция для группировки точек обзорного масштаба по сохраненным номерам ячеек.
+    # Результат совпадает с aggregate: те же ячейки в том же порядке
+    def aggregate_precomputed(self, positions, provider, zoom):
+        cell_ids, keys = self.cells[zoom]
+        total = len(keys)
+        cells = cell_ids[positions].astype(np.intp)
+        count = np.bincount(cells, minlength=total)
+        used = np.flatnonzero(count)
+        if len(used) == 0:
+            return empty_table()
+
+        speed = self.index.speed[provider][positions]
+        speed_min = np.full(total, np.inf)
+        np.minimum.at(speed_min, cells, speed)
+        first = np.full(total, np.iinfo(np.intp).max)
+        np.minimum.at(first, cells, positions)
+        count = count[used]
+
+        return ClusterTable(
+            count=count,
+            lat=np.bincount(cells, weights=self.index.lat[positions], minlength=total)[used] / count,
+            lng=np.bincount(cells, weights=self.index.lng[positions], minlength=total)[used] / count,
+            speed_sum=np.bincount(cells, weights=speed, minlength=total)[used],
+            speed_min=speed_min[used],
+            providers={name: np.bincount(cells, weights=self.index.flags[name][positions],
+                                         minlength=total)[used].astype(np.int64)
+                       for name in PROVIDERS},
+            first=first[used],
+            key=keys[used]
+        )
+
+    # Функция для проверки, что запрос можно ответить заранее построенной таблицей:
+    # кроме провайдера и bbox фильтров нет, а диапазон скорости покрывает все точки
+    def precomputed_applies(self, query):
+        if query.min_upload is not None or query.max_upload is not None or query.city is not None:
+            return False
+        sorted_speed = self.index.sorted_speed[query.provider]
+        if not query.speed_bounded or len(sorted_speed) == 0:
+            return not query.speed_bounded
+        return ((query.min_speed is None or query.min_speed <= sorted_speed[0]) and
+                (query.max_speed is None or query.max_speed >= sorted_speed[-1]))
+
+    # Функция для получения кластеров и отдельных точек в области просмотра
+    def query(self, query, zoom):
+        zoom = clamp_zoom(zoom)
+
+        cell_range = None if query.bbox is None else self.cell_range(query.bbox, zoom)
+
+        if zoom <= PRECOMPUTED_MAX_ZOOM and self.precomputed_applies(query):
+            table = self.tables[query.provider][zoom]
+            if cell_range is not None:
+                table = table.take(self.keys_in_range(table.key, cell_range, zoom))
+        else:
+            # Точки отбираются по ячейкам, пересекающим bbox, а не по самому bbox
+            positions = query.without_bbox().positions(self.index)
+            # Строки без скорости не кластеризуются (как и в заранее построенных таблицах)
+            positions = positions[~np.isnan(self.index.speed[query.provider][positions])]
+            if cell_range is not None:
+                positions = positions[self.keys_in_range(self.cell_keys(positions, zoom), cell_range, zoom)]
+            if zoom >= LEAF_ZOOM:
+                return None, positions
+            if zoom <= PRECOMPUTED_MAX_ZOOM:
+                table = self.aggregate_precomputed(positions, query.provider, zoom)
+            else:
+                table = self.aggregate(positions, query.provider, zoom)
+
+        # Ячейки из одной точки возвращаются как отдельные точки
+        single = table.count == 1
+        return table.take(~single), np.sort(table.first[single])
+
+    # Функция для формирования JSON-ответа с кластерами и отдельными точками
+    def to_json(self, provider, table, positions, zoom):
+        clusters = []
+        if table is not None:
+            mean_speed = table.speed_sum / table.count
+            for i in range(len(table.count)):
+                clusters.append({
+                    'lat': float(table.lat[i]),
+                    'lng': float(table.lng[i]),
+                    'count': int(table.count[i]),
+                    'mean_speed': float(mean_speed[i]),
+                    'min_speed': float(table.speed_min[i]),
+                    'providers': {name: int(table.providers[name][i]) for name in PROVIDERS}
+                })
+
+        index = self.index
+        points = points_json(index.lat[positions], index.lng[positions], index.speed[provider][positions],
+                             kt=index.flags['kt'][positions], beeline=index.flags['beeline'][positions],
+                             almatv=index.flags['almatv'][positions],
+                             address_literals=index.address_literals(positions))
+        return ('{"clusters":' + json.dumps(clusters, sort_keys=True) +
+                ',"points":' + points.rstrip('\n') + ',"zoom":' + str(zoom) + '}\n')
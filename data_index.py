@@ -0,0 +1,104 @@
+# data_index.py - Индекс набора данных, строящийся один раз при загрузке
+#
+# Запросы карты больше не копируют весь DataFrame: очищенные координаты,
+# маски провайдеров, максимальная скорость и отсортированные по скорости
+# порядки строк считаются заранее. Диапазон скоростей находится через
+# np.searchsorted, поэтому запрос выделяет память только под найденные строки.
+import numpy as np
+import pandas as pd
+
+from map_payload import compact_strings, default_addresses, encode_strings
+
+PROVIDERS = ('kt', 'beeline', 'almatv')
+
+# Ключ выборки "все провайдеры" - используется максимальная скорость загрузки
+ALL_PROVIDERS = 'all'
+
+LAT_COLUMN = 'latitude_speedtest'
+LNG_COLUMN = 'longitude_speedtest'
+
+
+class DatasetIndex:
+    def __init__(self, data):
+        # Позиции строк с заполненными координатами (в исходном DataFrame)
+        lat = data[LAT_COLUMN].to_numpy(dtype=float)
+        lng = data[LNG_COLUMN].to_numpy(dtype=float)
+        self.row_ids = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        self.lat = lat[self.row_ids]
+        self.lng = lng[self.row_ids]
+
+        # Маски провайдеров по строкам с координатами
+        self.flags = {}
+        self.positions = {ALL_PROVIDERS: np.arange(len(self.row_ids))}
+        self.speed = {}
+        self.upload = {}
+        for provider in PROVIDERS:
+            flag = data[f"{provider}_speedtest"].to_numpy(dtype=float) == 1
+            self.flags[provider] = flag[self.row_ids]
+            self.positions[provider] = np.flatnonzero(self.flags[provider])
+            self.speed[provider] = data[f"{provider}_download_speed"].to_numpy(dtype=float)[self.row_ids]
+            self.upload[provider] = data[f"{provider}_upload_speed"].to_numpy(dtype=float)[self.row_ids]
+
+        # Максимальная скорость из доступных (NaN игнорируются, как max(skipna=True))
+        for speeds in (self.speed, self.upload):
+            speeds[ALL_PROVIDERS] = np.fmax(np.fmax(speeds['kt'], speeds['beeline']), speeds['almatv'])
+
+        # Порядки строк, отсортированные по скорости, для каждого варианта выборки
+        self.orders = {}
+        self.sorted_speed = {}
+        for key, speed in self.speed.items():
+            candidates = ~np.isnan(speed)
+            if key != ALL_PROVIDERS:
+                candidates &= self.flags[key]
+            candidates = np.flatnonzero(candidates)
+            order = candidates[np.argsort(speed[candidates], kind='stable')]
+            self.orders[key] = order
+            self.sorted_speed[key] = speed[order]
+
+        # Коды городов для фильтра по isb_town (-1 - город не указан)
+        if 'isb_town' in data.columns:
+            codes, towns = pd.factorize(data['isb_town'])
+            self.city_codes = codes[self.row_ids].astype(np.int32)
+            self.city_names = [str(town) for town in towns]
+        else:
+            self.city_codes = None
+            self.city_names = []
+
+        # Адреса кодируются в JSON один раз на уникальное значение
+        if 'address' in data.columns:
+            codes, self.address_table = encode_strings(data['address'].to_numpy()[self.row_ids])
+            self.address_codes = codes.astype(np.int32)
+        else:
+            self.address_codes = None
+            self.address_table = None
+
+    # Позиции (в массивах индекса) строк провайдера со скоростью в [min_speed, max_speed],
+    # в исходном порядке строк
+    def select(self, provider, min_speed, max_speed):
+        sorted_speed = self.sorted_speed[provider]
+        if np.isnan(min_speed) or np.isnan(max_speed):
+            return np.empty(0, dtype=np.intp)
+        lo = np.searchsorted(sorted_speed, min_speed, side='left')
+        hi = np.searchsorted(sorted_speed, max_speed, side='right')
+        if hi <= lo:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(self.orders[provider][lo:hi])
+
+    # Коды городов, название которых совпадает с city без учета регистра
+    def city_matches(self, city):
+        city = city.strip().casefold()
+        return np.array([code for code, name in enumerate(self.city_names)
+                         if name.strip().casefold() == city], dtype=np.int32)
+
+    # JSON-литералы адресов для выбранных позиций
+    def address_literals(self, positions):
+        if self.address_codes is None:
+            return None
+        return self.address_table[self.address_codes[positions]].tolist()
+
+    # Коды адресов выбранных позиций и таблица только встречающихся адресов
+    # (для форматов columnar и binary)
+    def address_subset(self, positions):
+        if self.address_codes is None:
+            return default_addresses(len(positions))
+        return compact_strings(self.address_codes[positions], self.address_table)
@@ -0,0 +1,193 @@
+# dataset.py - Версионированный набор данных с горячей перезагрузкой
+#
+# Dataset объединяет DataFrame и все структуры, построенные при загрузке
+# (индекс, кластеры, тайлы, агрегаты по ячейкам). DatasetManager хранит ссылку на текущую версию:
+# новая версия собирается целиком вне обработки запросов, после чего ссылка
+# заменяется одним присваиванием. Запрос берет ссылку один раз в начале и
+# до конца работает со своей версией, даже если данные уже перезагружены.
+import os
+import threading
+import time
+
+import pandas as pd
+
+from clustering import ClusterIndex
+from data_index import DatasetIndex
+from rollups import RollupIndex
+from snapshot import SNAPSHOT_DIR, load_versioned_dataset, prune_snapshots
+from tiles import TILE_CACHE_DIR, TileRenderer, prune_tile_cache
+
+
+# Функция для получения текущего RSS процесса в байтах
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # На Linux ru_maxrss в килобайтах; это пиковое, а не текущее значение
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Замер пикового RSS фоновым потоком: в отличие от tracemalloc не замедляет
+# выделения памяти в потоках, обслуживающих запросы во время перезагрузки
+class RssSampler:
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+
+# Функция для получения сигнатуры файла (время изменения и размер)
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Dataset:
+    def __init__(self, data, version, signature=None, tile_cache_dir=TILE_CACHE_DIR):
+        self.data = data
+        self.version = version
+        self.signature = signature
+        self.tile_cache_dir = tile_cache_dir
+        self.loaded_at = time.time()
+        self.empty = data.empty
+
+        # Индексы строятся сразу, чтобы запросы не платили за них
+        if self.empty:
+            self.index = None
+            self.clusters = None
+            self.tiles = None
+            self.rollups = None
+        else:
+            self.index = DatasetIndex(data)
+            self.clusters = ClusterIndex(self.index)
+            self.tiles = TileRenderer(self.index, version, tile_cache_dir)
+            self.rollups = RollupIndex(self.index)
+
+    # Функция для загрузки набора данных из исходного файла (через снимок)
+    @classmethod
+    def load(cls, source_path, snapshot_dir=SNAPSHOT_DIR, tile_cache_dir=TILE_CACHE_DIR):
+        # Сигнатура берется до чтения: изменение во время загрузки будет замечено позже
+        signature = file_signature(source_path)
+        data, version = load_versioned_dataset(source_path, snapshot_dir)
+        return cls(data, version, signature, tile_cache_dir)
+
+    # Пустой набор данных (при ошибке загрузки)
+    @classmethod
+    def empty_dataset(cls):
+        return cls(pd.DataFrame(), 'empty')
+
+    # Строки, удовлетворяющие запросу (без копирования всего кадра)
+    def frame(self, query):
+        if self.empty:
+            return self.data
+        return query.frame(self.data, self.index)
+
+
+class DatasetManager:
+    def __init__(self, source_path, snapshot_dir=SNAPSHOT_DIR, tile_cache_dir=TILE_CACHE_DIR):
+        self.source_path = source_path
+        self.snapshot_dir = snapshot_dir
+        self.tile_cache_dir = tile_cache_dir
+        self.current = None
+        self.last_reload = None
+        # Функции, вызываемые после замены версии: callback(new, old)
+        self.listeners = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+
+    # Первичная загрузка; при ошибке используется пустой набор данных
+    def load_initial(self):
+        try:
+            self.current = Dataset.load(self.source_path, self.snapshot_dir, self.tile_cache_dir)
+            print(f"Данные загружены успешно. Количество строк: {len(self.current.data)}")
+        except Exception as e:
+            print(f"Ошибка при загрузке данных: {e}")
+            self.current = Dataset.empty_dataset()
+        return self.current
+
+    # Атомарная замена текущей версии
+    def swap(self, dataset):
+        previous = self.current
+        self.current = dataset
+        for listener in self.listeners:
+            listener(dataset, previous)
+        # Тайлы прежних версий больше не нужны; до замены ими пользовались запросы
+        if dataset.tile_cache_dir is not None and dataset.version != (previous.version if previous else None):
+            prune_tile_cache(dataset.tile_cache_dir, keep=dataset.version)
+        return previous
+
+    # Изменился ли исходный файл с момента загрузки текущей версии
+    def changed(self):
+        signature = file_signature(self.source_path)
+        return signature is not None and signature != self.current.signature
+
+    # Функция для перезагрузки данных; возвращает отчет или None, если файл не менялся
+    def reload(self, force=False):
+        with self._reload_lock:
+            if not force and not self.changed():
+                return None
+
+            previous = self.current
+            rss_before = current_rss()
+            started = time.perf_counter()
+            with RssSampler() as sampler:
+                dataset = Dataset.load(self.source_path, self.snapshot_dir, self.tile_cache_dir)
+                load_seconds = time.perf_counter() - started
+                self.swap(dataset)
+
+            report = {
+                'version': dataset.version,
+                'previous_version': previous.version if previous else None,
+                'rows': len(dataset.data),
+                'load_seconds': round(load_seconds, 4),
+                'total_seconds': round(time.perf_counter() - started, 4),
+                'rss_before_bytes': rss_before,
+                'rss_peak_bytes': sampler.peak,
+                'rss_after_bytes': current_rss()
+            }
+            self.last_reload = report
+            print(f"Данные перезагружены: версия {report['version']}, строк {report['rows']}, "
+                  f"{report['total_seconds']} с, пик RSS {sampler.peak / 2 ** 20:.1f} МиБ")
+
+            # Снимки прежних версий больше не нужны (открытые mmap остаются валидными)
+            if dataset.version != (previous.version if previous else None):
+                prune_snapshots(self.source_path, self.snapshot_dir, keep=dataset.version)
+            return report
+
+    # Запуск фонового потока, проверяющего исходный файл каждые interval секунд
+    def watch(self, interval):
+        if self._watcher is not None:
+            return self._watcher
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Ошибка при перезагрузке данных: {e}")
+
+        self._watcher = threading.Thread(target=loop, name='dataset-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
@@ -0,0 +1,115 @@
+# export.py - Потоковая выгрузка отфильтрованных строк (CSV, NDJSON, Parquet)
+#
+# Строки выгружаются частями по chunk_rows: генератор берет из DataFrame только
+# очередную часть, сериализует ее и отдает серверу. Следующая часть готовится,
+# когда сервер отправил предыдущую клиенту, поэтому объем памяти определяется
+# размером части, а не размером выгрузки. Parquet пишется по одной группе
+# строк на часть (pyarrow - необязательная зависимость).
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+# Функция для перебора частей выгрузки: строки исходного DataFrame по номерам rows
+def iter_chunks(data, rows, chunk_rows):
+    for start in range(0, len(rows), chunk_rows):
+        yield data.take(rows[start:start + chunk_rows])
+
+
+# Выгрузка в CSV (заголовок - только в первой части)
+def csv_stream(data, rows, chunk_rows):
+    if len(rows) == 0:
+        yield data.iloc[:0].to_csv(index=False).encode('utf-8')
+        return
+    header = True
+    for chunk in iter_chunks(data, rows, chunk_rows):
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+# Выгрузка в NDJSON: один JSON-объект на строку
+def ndjson_stream(data, rows, chunk_rows):
+    for chunk in iter_chunks(data, rows, chunk_rows):
+        yield chunk.to_json(orient='records', lines=True, force_ascii=False, double_precision=15).encode('utf-8')
+
+
+# Файлоподобный объект для pyarrow: накапливает записанные байты до отправки
+class _ChunkSink:
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    # Функция для получения накопленных байтов с очисткой буфера
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+# Проверка наличия pyarrow для выгрузки в Parquet
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Выгрузка в Parquet: одна группа строк на часть
+def parquet_stream(data, rows, chunk_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Схема берется по типам колонок, а не по первой части (в ней колонка может быть пустой).
+    # По пустому срезу колонки object получают тип null, поэтому они выгружаются
+    # строками: значения приводятся к строке в каждой части (None остается пустым)
+    text_columns = {name: 'string' for name, dtype in data.dtypes.items() if dtype == object}
+    schema = pa.Schema.from_pandas(data.iloc[:0].astype(text_columns), preserve_index=False)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in iter_chunks(data, rows, chunk_rows):
+            if text_columns:
+                chunk = chunk.astype(text_columns)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+STREAMS = {
+    'csv': csv_stream,
+    'ndjson': ndjson_stream,
+    'parquet': parquet_stream
+}
+
+
+# Функция для получения генератора выгрузки в заданном формате
+def export_stream(export_format, data, rows, chunk_rows):
+    return STREAMS[export_format](data, rows, chunk_rows)
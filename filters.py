@@ -0,0 +1,159 @@
+# filters.py - Общий конвейер фильтрации для карты, статистики и графиков
+#
+# DataQuery проверяет параметры запроса и лениво вычисляет набор строк
+# поверх индекса данных (DatasetIndex): маски комбинируются только по уже
+# отобранным позициям, копия DataFrame не создается. Один и тот же запрос
+# дает одинаковый набор строк для /get_map, /get_clusters, /tiles,
+# /get_stats и /get_charts.
+import math
+
+import numpy as np
+
+from data_index import ALL_PROVIDERS, PROVIDERS
+
+
+# Ошибка в параметрах запроса (возвращается клиенту с кодом 400)
+class QueryError(ValueError):
+    pass
+
+
+# Функция для разбора bbox в формате Leaflet: "west,south,east,north"
+def parse_bbox(value):
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise QueryError(f"Некорректный bbox: {value}")
+    if not all(map(math.isfinite, (west, south, east, north))) or west > east or south > north:
+        raise QueryError(f"Некорректный bbox: {value}")
+    return west, south, east, north
+
+
+class DataQuery:
+    def __init__(self, provider=ALL_PROVIDERS, min_speed=None, max_speed=None,
+                 min_upload=None, max_upload=None, city=None, bbox=None):
+        if provider != ALL_PROVIDERS and provider not in PROVIDERS:
+            raise QueryError(f"Неизвестный провайдер: {provider}")
+        self.provider = provider
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.min_upload = min_upload
+        self.max_upload = max_upload
+        self.city = city
+        self.bbox = bbox
+        # Лениво вычисленные позиции строк (для конкретного индекса)
+        self._index = None
+        self._positions = None
+
+    # Функция для создания запроса из параметров URL (defaults - значения по умолчанию)
+    @classmethod
+    def from_args(cls, args, defaults=None):
+        defaults = defaults or {}
+
+        def number(name):
+            value = args.get(name)
+            if value is None or value == '':
+                return defaults.get(name)
+            try:
+                result = float(value)
+            except ValueError:
+                raise QueryError(f"Некорректное значение параметра {name}: {value}")
+            if math.isnan(result):
+                raise QueryError(f"Некорректное значение параметра {name}: {value}")
+            return result
+
+        return cls(
+            provider=args.get('provider', ALL_PROVIDERS),
+            min_speed=number('min_speed'),
+            max_speed=number('max_speed'),
+            min_upload=number('min_upload'),
+            max_upload=number('max_upload'),
+            city=args.get('city') or None,
+            bbox=parse_bbox(args.get('bbox'))
+        )
+
+    # Тот же запрос без области просмотра
+    def without_bbox(self):
+        return DataQuery(self.provider, self.min_speed, self.max_speed,
+                         self.min_upload, self.max_upload, self.city)
+
+    # Ключ запроса для кэшей
+    def key(self):
+        return (self.provider, self.min_speed, self.max_speed,
+                self.min_upload, self.max_upload, self.city, self.bbox)
+
+    @property
+    def speed_bounded(self):
+        return self.min_speed is not None or self.max_speed is not None
+
+    # Нет фильтров кроме провайдера
+    @property
+    def provider_only(self):
+        return (not self.speed_bounded and self.min_upload is None and self.max_upload is None
+                and self.city is None and self.bbox is None)
+
+    # Позиции строк (в массивах индекса), удовлетворяющих запросу, в исходном порядке
+    def positions(self, index):
+        if self._index is index:
+            return self._positions
+
+        if self.speed_bounded:
+            # Диапазон скорости находится бинарным поиском по отсортированным строкам
+            lo = -np.inf if self.min_speed is None else self.min_speed
+            hi = np.inf if self.max_speed is None else self.max_speed
+            positions = index.select(self.provider, lo, hi)
+        else:
+            positions = index.positions[self.provider]
+        positions = positions[self._mask(index, positions, core=False)]
+
+        self._index, self._positions = index, positions
+        return positions
+
+    # Маска произвольных позиций-кандидатов (например, точек тайла) по всем фильтрам
+    def mask(self, index, positions):
+        return self._mask(index, positions, core=True)
+
+    # Маска по кандидатам; core - применять ли фильтр провайдера и скорости загрузки
+    def _mask(self, index, positions, core):
+        mask = np.ones(len(positions), dtype=bool)
+
+        if core:
+            if self.provider != ALL_PROVIDERS:
+                mask &= index.flags[self.provider][positions]
+            if self.speed_bounded:
+                speed = index.speed[self.provider][positions]
+                if self.min_speed is not None:
+                    mask &= speed >= self.min_speed
+                if self.max_speed is not None:
+                    mask &= speed <= self.max_speed
+                # NaN не попадает ни в один диапазон
+                mask &= ~np.isnan(speed)
+
+        if self.min_upload is not None or self.max_upload is not None:
+            upload = index.upload[self.provider][positions]
+            mask &= ~np.isnan(upload)
+            if self.min_upload is not None:
+                mask &= upload >= self.min_upload
+            if self.max_upload is not None:
+                mask &= upload <= self.max_upload
+
+        if self.city is not None:
+            if index.city_codes is None:
+                mask[:] = False
+            else:
+                mask &= np.isin(index.city_codes[positions], index.city_matches(self.city))
+
+        if self.bbox is not None:
+            west, south, east, north = self.bbox
+            lat = index.lat[positions]
+            lng = index.lng[positions]
+            mask &= (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+
+        return mask
+
+    # Строки исходного DataFrame для статистики и графиков
+    def frame(self, data, index):
+        if self.provider == ALL_PROVIDERS and self.provider_only:
+            return data
+        return data.take(index.row_ids[self.positions(index)])
@@ -0,0 +1,52 @@
+# gunicorn.conf.py - Конфигурация gunicorn для продакшена
+#
+# Запуск: gunicorn -c gunicorn.conf.py
+# preload_app загружает данные и индексы один раз в главном процессе, рабочие
+# процессы получают их копированием при записи (как в serve.py).
+# Перезагрузка данных: kill -HUP <pid главного процесса>. При preload_app
+# gunicorn не импортирует приложение заново, поэтому новая версия данных
+# загружается в главном процессе хуком on_reload, после чего gunicorn
+# поочередно заменяет рабочие процессы (как SIGHUP в serve.py).
+import gc
+import os
+
+wsgi_app = 'app:app'
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+
+# Проверка файла данных потоком внутри app не переживает fork
+os.environ.pop('DATA_WATCH_INTERVAL', None)
+
+
+# Подготовка главного процесса перед fork: прогрев кэша и заморозка объектов,
+# чтобы сборщик мусора в рабочих процессах не копировал общие страницы
+def prepare(app_module):
+    gc.unfreeze()
+    gc.collect()
+    ds = app_module.datasets.current
+    if not ds.empty:
+        app_module.warm_stats_cache(ds)
+    gc.freeze()
+
+
+# Перед созданием рабочих процессов
+def when_ready(server):
+    import app as app_module
+
+    # /admin/reload в рабочих процессах передает перезагрузку главному процессу
+    app_module.MULTIPROCESS = True
+    prepare(app_module)
+
+
+# SIGHUP: загрузка новой версии данных (если файл изменился) до создания
+# новых рабочих процессов
+def on_reload(server):
+    import app as app_module
+
+    report = app_module.datasets.reload()
+    if report is not None:
+        server.log.info("Загружена версия данных %s", report['version'])
+    prepare(app_module)
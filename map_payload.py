@@ -0,0 +1,221 @@
+# map_payload.py - Векторизованная сериализация точек карты в JSON
+#
+# Вместо iterrows() и словаря на каждую точку колонки обрабатываются
+# целиком средствами NumPy, а JSON собирается из готовых строковых колонок.
+# Результат побайтно совпадает с jsonify() в компактном режиме Flask
+# (sort_keys=True, ensure_ascii=True, завершающий перевод строки).
+#
+# Кроме массива объектов поддерживаются компактные форматы без повторения
+# ключей: columnar (параллельные JSON-массивы) и binary (Float32-колонки,
+# битовая маска провайдеров и таблица уникальных адресов), которые
+# map_handler.js читает напрямую в типизированные массивы.
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Пороги скорости (Мбит/с) для цвета маркера
+LOW_SPEED = 50
+MEDIUM_SPEED = 100
+
+# Адрес по умолчанию, если в данных нет колонки address
+DEFAULT_ADDRESS = 'Точка интернета'
+
+# Шаблоны объектов с ключами в алфавитном порядке (как sort_keys=True)
+POINT_TEMPLATE = ('{"address":%s,"color":"%s","lat":%s,"lng":%s,'
+                  '"providers":{"almatv":%s,"beeline":%s,"kt":%s},"speed":%s}')
+HEAT_TEMPLATE = '{"lat":%s,"lng":%s,"value":%s}'
+
+EMPTY_JSON = '[]\n'
+
+# Форматы ответа /get_map
+PAYLOAD_FORMATS = ('json', 'columnar', 'binary')
+
+# Биты провайдеров в маске точки
+PROVIDER_BITS = {'kt': 1, 'beeline': 2, 'almatv': 4}
+
+# Заголовок бинарного формата (little-endian, 20 байт):
+# сигнатура, версия, вид (0 - точки, 1 - тепловая карта), размер кода адреса (2 или 4),
+# резерв, число точек, число адресов, длина таблицы адресов в байтах
+BINARY_MAGIC = b'KTPT'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBBBxIII')
+BINARY_POINTS = 0
+BINARY_HEATMAP = 1
+
+
+# Функция для определения цвета маркера по скорости
+def speed_colors(speed):
+    speed = np.asarray(speed, dtype=float)
+    return np.select([speed < LOW_SPEED, speed < MEDIUM_SPEED], ['red', 'orange'], 'green')
+
+
+# Функция для представления массива float так же, как это делает json.dumps
+def float_literals(values):
+    values = np.asarray(values, dtype=float)
+    literals = list(map(float.__repr__, values.tolist()))
+    special = np.flatnonzero(~np.isfinite(values))
+    for i in special.tolist():
+        v = values[i]
+        literals[i] = 'NaN' if v != v else ('Infinity' if v > 0 else '-Infinity')
+    return literals
+
+
+# Функция для представления булева массива как JSON true/false
+def bool_literals(values):
+    return np.where(np.asarray(values, dtype=bool), 'true', 'false').tolist()
+
+
+# Функция для кодирования строк: каждое уникальное значение кодируется один раз.
+# Возвращает коды строк и таблицу JSON-литералов; код -1 (пропуск) указывает
+# на последний элемент таблицы - 'NaN', как у jsonify
+def encode_strings(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    table = np.array([json.dumps(u, ensure_ascii=True) for u in uniques] + ['NaN'], dtype=object)
+    return codes, table
+
+
+# Функция для представления массива строк как JSON-литералов
+def string_literals(values):
+    codes, table = encode_strings(values)
+    return table[codes].tolist()
+
+
+# Функция для сборки JSON-массива точек карты
+# (address_literals - уже закодированные адреса, например из индекса данных)
+def points_json(lat, lng, speed, kt, beeline, almatv, address=None, address_literals=None):
+    n = len(lat)
+    if n == 0:
+        return EMPTY_JSON
+
+    if address_literals is not None:
+        addresses = address_literals
+    elif address is None:
+        addresses = [json.dumps(DEFAULT_ADDRESS)] * n
+    else:
+        addresses = string_literals(address)
+
+    rows = zip(addresses, speed_colors(speed).tolist(), float_literals(lat), float_literals(lng),
+               bool_literals(almatv), bool_literals(beeline), bool_literals(kt), float_literals(speed))
+    return '[' + ','.join([POINT_TEMPLATE % row for row in rows]) + ']\n'
+
+
+# Функция для сборки JSON-массива точек тепловой карты
+def heatmap_json(lat, lng, values=None):
+    n = len(lat)
+    if n == 0:
+        return EMPTY_JSON
+
+    # Для тепловой карты по плотности значение постоянно и равно 1
+    value_literals = ['1'] * n if values is None else float_literals(values)
+    rows = zip(float_literals(lat), float_literals(lng), value_literals)
+    return '[' + ','.join([HEAT_TEMPLATE % row for row in rows]) + ']\n'
+
+
+# Функция для сборки битовой маски провайдеров (uint8)
+def provider_mask(kt, beeline, almatv):
+    mask = np.zeros(len(kt), dtype=np.uint8)
+    for bit, flags in ((PROVIDER_BITS['kt'], kt), (PROVIDER_BITS['beeline'], beeline),
+                       (PROVIDER_BITS['almatv'], almatv)):
+        mask[np.asarray(flags, dtype=bool)] |= bit
+    return mask
+
+
+# Функция для сжатия таблицы строк до значений, встречающихся в codes.
+# table - JSON-литералы (как у encode_strings); пропуск ('NaN') заменяется на null
+def compact_strings(codes, table):
+    used, codes = np.unique(codes, return_inverse=True)
+    literals = ['null' if literal == 'NaN' else literal for literal in table[used].tolist()]
+    return codes.astype(np.uint32), literals
+
+
+# Таблица адресов для точек без колонки address
+def default_addresses(n):
+    return np.zeros(n, dtype=np.uint32), [json.dumps(DEFAULT_ADDRESS)]
+
+
+# Функция для представления массива float в JSON (NaN - null)
+def _float_array(values):
+    literals = float_literals(values)
+    for i in np.flatnonzero(np.isnan(np.asarray(values, dtype=float))).tolist():
+        literals[i] = 'null'
+    return '[' + ','.join(literals) + ']'
+
+
+# Функция для представления массива целых чисел в JSON
+def _int_array(values):
+    return '[' + ','.join(map(str, np.asarray(values).tolist())) + ']'
+
+
+# Функция для сборки JSON с параллельными массивами (ключи в алфавитном порядке)
+def _columnar(fields):
+    return '{' + ','.join(f'"{name}":{value}' for name, value in sorted(fields.items())) + '}\n'
+
+
+# Точки карты в формате columnar: адрес точки - индекс в таблице address
+def points_columnar(lat, lng, speed, providers, address_codes, address_literals):
+    return _columnar({
+        'count': str(len(lat)),
+        'lat': _float_array(lat),
+        'lng': _float_array(lng),
+        'speed': _float_array(speed),
+        'providers': _int_array(providers),
+        'address_code': _int_array(address_codes),
+        'address': '[' + ','.join(address_literals) + ']'
+    })
+
+
+# Точки тепловой карты в формате columnar (для плотности value отсутствует)
+def heatmap_columnar(lat, lng, values=None):
+    fields = {'count': str(len(lat)), 'lat': _float_array(lat), 'lng': _float_array(lng)}
+    if values is not None:
+        fields['value'] = _float_array(values)
+    return _columnar(fields)
+
+
+# Функция для сборки бинарного ответа: заголовок, Float32-колонки,
+# затем (для точек) маска провайдеров, коды адресов и JSON-таблица адресов.
+# Каждая колонка выровнена на 4 байта, чтобы браузер читал ее без копирования
+def _binary(kind, columns, providers=None, address_codes=None, address_literals=None):
+    n = len(columns[0])
+    parts = [np.asarray(column, dtype='<f4').tobytes() for column in columns]
+    address_count = 0
+    address_bytes = b''
+    code_size = 0
+    if providers is not None:
+        address_count = len(address_literals)
+        address_bytes = ('[' + ','.join(address_literals) + ']').encode('utf-8')
+        code_size = 2 if address_count <= 0xffff else 4
+        parts.append(np.asarray(providers, dtype=np.uint8).tobytes())
+        parts.append(b'\0' * (-n % 4))
+        parts.append(np.asarray(address_codes, dtype='<u2' if code_size == 2 else '<u4').tobytes())
+        parts.append(b'\0' * (-n * code_size % 4))
+        parts.append(address_bytes)
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, kind, code_size, n, address_count, len(address_bytes))
+    return header + b''.join(parts)
+
+
+# Точки карты в бинарном формате
+def points_binary(lat, lng, speed, providers, address_codes, address_literals):
+    return _binary(BINARY_POINTS, (lat, lng, speed), providers, address_codes, address_literals)
+
+
+# Точки тепловой карты в бинарном формате (для плотности значение равно 1)
+def heatmap_binary(lat, lng, values=None):
+    values = np.ones(len(lat)) if values is None else values
+    return _binary(BINARY_HEATMAP, (lat, lng, values))
+
+
+# Пустой ответ /get_map в заданном формате
+def empty_payload(map_type, payload_format):
+    empty = np.empty(0)
+    if payload_format == 'json':
+        return EMPTY_JSON
+    if map_type == 'points':
+        codes, literals = np.empty(0, dtype=np.uint32), []
+        encode = points_columnar if payload_format == 'columnar' else points_binary
+        return encode(empty, empty, empty, np.empty(0, dtype=np.uint8), codes, literals)
+    values = empty if map_type == 'heatmap_speed' else None
+    encode = heatmap_columnar if payload_format == 'columnar' else heatmap_binary
+    return encode(empty, empty, values)
@@ -0,0 +1,195 @@
+# metrics.py - Метрики запросов: этапы обработки, строки, байты, кэш
+#
+# Каждый запрос получает RequestMetrics (в flask.g): маршрут отмечает этапы
+# через with phase('filter'): ..., число строк и обращения к кэшу. После ответа
+# длительности этапов попадают в заголовок Server-Timing и в гистограммы
+# реестра, который отдается в формате Prometheus (/metrics).
+# Метрики хранятся в памяти процесса: при нескольких рабочих процессах
+# каждый из них отдает свои значения.
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Границы корзин гистограмм длительности (секунды)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Функция для экранирования значения метки Prometheus
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Функция для представления набора меток: {name="value",...}
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Имя метрики -> (тип, описание, имена меток)
+        self._meta = {}
+        # Имя метрики -> {значения меток: значение} (для гистограмм - [корзины, сумма, количество])
+        self._values = {}
+        # Функции, обновляющие метрики перед выдачей (размер кэша, версия данных и т.п.)
+        self.collectors = []
+
+    def _register(self, kind, name, help_text, labelnames):
+        if name not in self._meta:
+            self._meta[name] = (kind, help_text, tuple(labelnames))
+            self._values[name] = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        self._register('counter', name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        self._register('gauge', name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=()):
+        self._register('histogram', name, help_text, labelnames)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            values = self._values[name]
+            values[labels] = values.get(labels, 0) + value
+
+    def set(self, name, labels=(), value=0):
+        with self._lock:
+            self._values[name][labels] = value
+
+    def clear(self, name):
+        with self._lock:
+            self._values[name].clear()
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            entry = self._values[name].get(labels)
+            if entry is None:
+                entry = self._values[name][labels] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # Функция для выдачи всех метрик в текстовом формате Prometheus
+    def render(self):
+        for collect in self.collectors:
+            collect(self)
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, labelnames) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{_labels(labelnames, labels)} {value}")
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels(labelnames, labels, [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labelnames, labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{_labels(labelnames, labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labelnames, labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Этап -> суммарная длительность в секундах (в порядке первого появления)
+        self.phases = {}
+        self.rows = None
+        # Кэш -> 'hit' или 'miss' (последнее обращение за запрос)
+        self.cache = {}
+
+
+# Метрики текущего запроса (None вне запроса)
+def current():
+    if has_request_context():
+        return g.get('request_metrics')
+    return None
+
+
+# Замер этапа обработки запроса; вне запроса ничего не делает
+@contextmanager
+def phase(name):
+    metrics = current()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.phases[name] = metrics.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+# Функция для учета числа строк, обработанных запросом
+def record_rows(count):
+    metrics = current()
+    if metrics is not None:
+        metrics.rows = (metrics.rows or 0) + int(count)
+
+
+# Функция для получения значения из кэша с учетом попаданий и промахов
+def cached(registry, cache, cache_name, key, compute):
+    missed = []
+
+    def compute_and_mark():
+        missed.append(True)
+        return compute()
+
+    value = cache.get_or_compute(key, compute_and_mark)
+    result = 'miss' if missed else 'hit'
+    registry.inc('app_cache_requests_total', (cache_name, result))
+    metrics = current()
+    if metrics is not None:
+        metrics.cache[cache_name] = result
+    return value
+
+
+# Функция для формирования заголовка Server-Timing
+def server_timing(metrics, total):
+    entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in metrics.phases.items()]
+    entries += [f'cache-{name};desc="{result}"' for name, result in metrics.cache.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
+
+
+# Функция для подключения метрик к приложению Flask
+def init_app(app, registry):
+    registry.counter('app_requests_total', 'Количество запросов', ('endpoint', 'method', 'status'))
+    registry.histogram('app_request_duration_seconds', 'Длительность обработки запроса', ('endpoint',))
+    registry.histogram('app_phase_duration_seconds', 'Длительность этапов обработки запроса', ('endpoint', 'phase'))
+    registry.counter('app_response_bytes_total', 'Объем ответов (без потоковых)', ('endpoint',))
+    registry.counter('app_rows_total', 'Количество строк, обработанных запросами', ('endpoint',))
+    registry.counter('app_cache_requests_total', 'Обращения к кэшу', ('cache', 'result'))
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_metrics = RequestMetrics()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None:
+            return response
+        total = time.perf_counter() - metrics.started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+        registry.inc('app_requests_total', (endpoint, request.method, str(response.status_code)))
+        registry.observe('app_request_duration_seconds', (endpoint,), total)
+        for name, duration in metrics.phases.items():
+            registry.observe('app_phase_duration_seconds', (endpoint, name), duration)
+        if metrics.rows is not None:
+            registry.inc('app_rows_total', (endpoint,), metrics.rows)
+        if not response.is_streamed and response.content_length is not None:
+            registry.inc('app_response_bytes_total', (endpoint,), response.content_length)
+
+        response.headers['Server-Timing'] = server_timing(metrics, total)
+        return response
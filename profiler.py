@@ -0,0 +1,92 @@
+# profiler.py - Выборочный профилировщик стеков всех потоков процесса
+#
+# Фоновый поток с периодом interval снимает стеки остальных потоков через
+# sys._current_frames() и считает, сколько раз встретился каждый стек.
+# Результат отдается в "свернутом" формате (функции через ';' и число
+# выборок), который принимают flamegraph.pl и speedscope. Включается
+# и выключается на работающем сервере без перезапуска.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Период выборки по умолчанию (секунды)
+DEFAULT_INTERVAL = 0.005
+
+# Минимальный период выборки: чаще поток выборки занимает процессор целиком
+MIN_INTERVAL = 0.001
+
+# Максимальная глубина стека в выборке
+MAX_DEPTH = 64
+
+
+# Функция для представления стека кадра: от корня к вершине через ';'
+def _stack(frame):
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = max(interval, MIN_INTERVAL)
+        self.samples = Counter()
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Функция для запуска профилировщика (накопленные выборки сбрасываются)
+    def start(self, interval=None):
+        if self.running:
+            return False
+        if interval:
+            self.interval = max(interval, MIN_INTERVAL)
+        with self._lock:
+            self.samples = Counter()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    # Функция для остановки профилировщика (выборки сохраняются)
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = [_stack(frame) for thread_id, frame in frames.items() if thread_id != own_id]
+            with self._lock:
+                self.samples.update(stacks)
+
+    # Количество выборок и статус
+    def status(self):
+        with self._lock:
+            total = sum(self.samples.values())
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'samples': total
+        }
+
+    # Функция для выдачи выборок в свернутом формате (самые частые стеки первыми)
+    def collapsed(self):
+        with self._lock:
+            items = self.samples.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
@@ -0,0 +1,76 @@
+# responses.py - Сжатие ответов и условные запросы (ETag / 304)
+#
+# Ответ карты полностью определяется версией данных и параметрами запроса,
+# поэтому ETag вычисляется до фильтрации: если у клиента уже есть ответ
+# для тех же фильтров, сервер отвечает 304 без обработки данных.
+# Тело сжимается brotli (если установлен пакет brotli) или gzip
+# в зависимости от заголовка Accept-Encoding.
+import gzip
+import hashlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Ответы меньше этого размера (в байтах) не сжимаются
+COMPRESS_MIN_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+# Функция для вычисления ETag по версии данных и параметрам ответа
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+# Функция для выбора кодировки сжатия по заголовку Accept-Encoding
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+# Функция для сжатия тела ответа выбранной кодировкой
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+# Проверка If-None-Match: есть ли у клиента актуальный ответ
+def not_modified(etag):
+    return request.if_none_match.contains_weak(etag)
+
+
+# Общие заголовки кэширования: браузер хранит ответ, но перепроверяет его по ETag
+def _cache_headers(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# Ответ 304 для неизменившихся данных
+def not_modified_response(etag):
+    return _cache_headers(current_app.response_class(status=304), etag)
+
+
+# Функция для формирования ответа со сжатием и ETag
+def payload_response(body, mimetype, etag):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+
+    encoding = choose_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    response = current_app.response_class(compress(body, encoding), mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return _cache_headers(response, etag)
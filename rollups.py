@@ -0,0 +1,173 @@
+# rollups.py - Предварительные агрегаты покрытия по городам и ячейкам geohash
+#
+# При загрузке набора данных для каждого уровня (город, geohash разной
+# точности) один раз строится таблица: число точек ячейки и для каждого
+# провайдера - число замеров, медианная скорость и доля точек медленнее
+# LOW_SPEED. Запрос /get_rollup только отбирает ячейки, попадающие в bbox,
+# и не обращается к исходным строкам.
+import json
+
+import numpy as np
+
+from data_index import PROVIDERS
+from map_payload import LOW_SPEED
+
+# Уровни агрегации: город и geohash заданной точности (число символов)
+CITY_LEVEL = 'city'
+GEOHASH_LEVELS = {'geohash5': 5, 'geohash6': 6, 'geohash7': 7}
+LEVELS = (CITY_LEVEL,) + tuple(GEOHASH_LEVELS)
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+# Функция для квантования координат на сетку geohash точности precision.
+# Возвращает номера столбца (долгота) и строки (широта) и число бит по каждой оси
+def geohash_grid(lat, lng, precision):
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    col = np.floor((np.asarray(lng, dtype=float) + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64)
+    row = np.floor((np.asarray(lat, dtype=float) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    col = np.clip(col, 0, (1 << lng_bits) - 1)
+    row = np.clip(row, 0, (1 << lat_bits) - 1)
+    return col, row, lng_bits, lat_bits
+
+
+# Функция для получения строк geohash по номерам ячеек сетки
+# (биты чередуются, начиная с долготы)
+def geohash_strings(col, row, lng_bits, lat_bits):
+    bits = lng_bits + lat_bits
+    code = np.zeros(len(col), dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (col >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (row >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    return [''.join(GEOHASH_ALPHABET[(value >> shift) & 31] for shift in range(bits - 5, -1, -5))
+            for value in code.tolist()]
+
+
+# Функция для вычисления медианы по группам: значения отсортированы по (группа, значение)
+def _group_medians(values, counts):
+    medians = np.full(len(counts), np.nan)
+    filled = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+    n = counts[filled]
+    medians[filled] = (values[starts + (n - 1) // 2] + values[starts + n // 2]) / 2
+    return medians
+
+
+class RollupTable:
+    # cells - номер ячейки для каждой строки индекса (-1 - строка не учитывается),
+    # speed_orders - позиции замеров каждого провайдера, отсортированные по скорости
+    def __init__(self, level, names, bounds, cells, index, speed_orders):
+        self.level = level
+        # Название ячейки (город или geohash) и ее границы: west, south, east, north
+        self.names = names
+        self.bounds = bounds
+        n = len(names)
+
+        counted = cells >= 0
+        self.count = np.bincount(cells[counted], minlength=n)
+        self.providers = {}
+        for provider in PROVIDERS:
+            speed = index.speed[provider]
+
+            # Медиана по группам: замеры уже упорядочены по скорости,
+            # устойчивая сортировка по ячейке сохраняет этот порядок внутри ячейки
+            order = speed_orders[provider]
+            order = order[cells[order] >= 0]
+            order = order[np.argsort(cells[order], kind='stable')]
+            measured_counts = np.bincount(cells[order], minlength=n)
+            low = np.bincount(cells[order], weights=speed[order] < LOW_SPEED, minlength=n)
+
+            self.providers[provider] = {
+                'count': np.bincount(cells[counted & index.flags[provider]], minlength=n),
+                'median_speed': _group_medians(speed[order], measured_counts),
+                'low_share': np.divide(low, measured_counts, out=np.full(n, np.nan), where=measured_counts > 0)
+            }
+
+    # Позиции ячеек, пересекающих bbox (west, south, east, north)
+    def select(self, bbox=None):
+        if bbox is None:
+            return np.arange(len(self.names))
+        west, south, east, north = bbox
+        b = self.bounds
+        return np.flatnonzero((b[:, 0] <= east) & (b[:, 2] >= west) & (b[:, 1] <= north) & (b[:, 3] >= south))
+
+    # Функция для сериализации выбранных ячеек в JSON
+    def to_json(self, positions):
+        def number(value):
+            return None if np.isnan(value) else round(float(value), 3)
+
+        cells = []
+        for i in positions.tolist():
+            cells.append({
+                'id': self.names[i],
+                'bounds': [round(float(v), 6) for v in self.bounds[i]],
+                'count': int(self.count[i]),
+                'providers': {
+                    provider: {
+                        'count': int(stats['count'][i]),
+                        'median_speed': number(stats['median_speed'][i]),
+                        'low_share': number(stats['low_share'][i])
+                    }
+                    for provider, stats in self.providers.items()
+                }
+            })
+        return json.dumps({'level': self.level, 'low_speed': LOW_SPEED, 'cells': cells}, sort_keys=True) + '\n'
+
+
+# Функция для построения таблицы по городам (границы - охват точек города)
+def city_rollup(index, speed_orders):
+    if index.city_codes is None:
+        return None
+    known = index.city_codes >= 0
+    cities, known_cells = np.unique(index.city_codes[known], return_inverse=True)
+    bounds = np.empty((len(cities), 4))
+    lat = index.lat[known]
+    lng = index.lng[known]
+    for column, values, reduce in ((0, lng, np.minimum), (1, lat, np.minimum),
+                                   (2, lng, np.maximum), (3, lat, np.maximum)):
+        bounds[:, column] = np.inf if reduce is np.minimum else -np.inf
+        reduce.at(bounds[:, column], known_cells, values)
+
+    # Строки без города в таблицу не попадают
+    cells = np.full(len(index.city_codes), -1, dtype=np.int64)
+    cells[known] = known_cells
+    return RollupTable(CITY_LEVEL, [index.city_names[c] for c in cities.tolist()], bounds, cells, index, speed_orders)
+
+
+# Функция для построения таблицы по ячейкам geohash
+def geohash_rollup(index, level, speed_orders):
+    col, row, lng_bits, lat_bits = geohash_grid(index.lat, index.lng, GEOHASH_LEVELS[level])
+    keys, cells = np.unique(col * (1 << lat_bits) + row, return_inverse=True)
+    cell_col = keys >> lat_bits
+    cell_row = keys & ((1 << lat_bits) - 1)
+
+    lng_step = 360.0 / (1 << lng_bits)
+    lat_step = 180.0 / (1 << lat_bits)
+    bounds = np.column_stack([cell_col * lng_step - 180.0, cell_row * lat_step - 90.0,
+                              (cell_col + 1) * lng_step - 180.0, (cell_row + 1) * lat_step - 90.0])
+    return RollupTable(level, geohash_strings(cell_col, cell_row, lng_bits, lat_bits), bounds, cells, index, speed_orders)
+
+
+class RollupIndex:
+    def __init__(self, data_index):
+        # Замеры провайдера, отсортированные по скорости, уже есть в индексе
+        speed_orders = {provider: data_index.orders[provider] for provider in PROVIDERS}
+
+        self.tables = {}
+        city = city_rollup(data_index, speed_orders)
+        if city is not None:
+            self.tables[CITY_LEVEL] = city
+        for level in GEOHASH_LEVELS:
+            self.tables[level] = geohash_rollup(data_index, level, speed_orders)
+
+    # Функция для получения JSON с ячейками уровня level в области bbox
+    def to_json(self, level, bbox=None):
+        table = self.tables.get(level)
+        if table is None:
+            return json.dumps({'level': level, 'low_speed': LOW_SPEED, 'cells': []}, sort_keys=True) + '\n'
+        return table.to_json(table.select(bbox))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# serve.py - Многопроцессный запуск приложения без сервера разработки
+#
+# Родительский процесс один раз загружает данные и строит индексы (импорт app),
+# прогревает кэш статистики и замораживает объекты сборщика мусора (gc.freeze),
+# после чего создает рабочие процессы через fork. Рабочие процессы получают
+# данные копированием при записи: массивы NumPy и снимок, открытый через mmap,
+# остаются общими страницами памяти. Все процессы принимают соединения
+# на одном слушающем сокете.
+#
+# Перезагрузка данных: SIGHUP (или изменение файла при DATA_WATCH_INTERVAL > 0)
+# загружает новую версию в родительском процессе и поочередно заменяет рабочие
+# процессы. SIGTERM/SIGINT завершают сервер, дожидаясь текущих запросов.
+#
+# Запуск:
+#   python serve.py --workers 4 --port 5000
+# Аналогичная конфигурация для gunicorn - gunicorn.conf.py.
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# Проверка файла данных выполняется родительским процессом, а не потоком в app
+# (потоки не переживают fork)
+WATCH_INTERVAL = float(os.environ.pop('DATA_WATCH_INTERVAL', 0))
+
+# Время ожидания завершения рабочего процесса (секунды)
+GRACEFUL_TIMEOUT = 30
+
+
+# Обработчик запросов без журнала каждого запроса
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+# Функция для создания слушающего сокета (общего для всех рабочих процессов)
+def listen(host, port, backlog=1024):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    def __init__(self, app_module, sock, workers, threaded=False, access_log=False):
+        self.app_module = app_module
+        self.sock = sock
+        self.workers = workers
+        self.threaded = threaded
+        self.access_log = access_log
+        # pid рабочего процесса -> версия данных, с которой он создан
+        self.children = {}
+        self.stopping = False
+        self.reload_requested = False
+
+    # Функция для создания рабочего процесса
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.app_module.datasets.current.version
+            return pid
+
+        # Рабочий процесс: стандартные сигналы и обслуживание запросов
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        status = 0
+        try:
+            host, port = self.sock.getsockname()[:2]
+            server = make_server(host, port, self.app_module.app, threaded=self.threaded, fd=self.sock.fileno(),
+                                 request_handler=None if self.access_log else QuietRequestHandler)
+            # shutdown() нельзя вызывать из потока serve_forever
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+            server.serve_forever()
+        except Exception as e:
+            print(f"Ошибка рабочего процесса {os.getpid()}: {e}", file=sys.stderr)
+            status = 1
+        finally:
+            os._exit(status)
+
+    # Функция для завершения рабочего процесса с ожиданием текущих запросов
+    def retire(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while time.monotonic() < deadline:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.pop(pid, None)
+
+    # Функция для перезагрузки данных и поочередной замены рабочих процессов
+    def reload(self):
+        report = self.app_module.datasets.reload()
+        if report is None:
+            return
+        self.prepare()
+        version = self.app_module.datasets.current.version
+        outdated = [pid for pid, v in self.children.items() if v != version]
+        for pid in outdated:
+            self.spawn()
+            self.retire(pid)
+        if outdated:
+            print(f"Рабочие процессы перезапущены с версией данных {version}")
+
+    # Подготовка родительского процесса перед fork: прогрев кэша и заморозка объектов
+    def prepare(self):
+        gc.unfreeze()
+        gc.collect()
+        ds = self.app_module.datasets.current
+        if not ds.empty:
+            self.app_module.warm_stats_cache(ds)
+        # Объекты, созданные до fork, не обходятся сборщиком мусора в рабочих
+        # процессах, поэтому их страницы памяти остаются общими
+        gc.freeze()
+
+    # Основной цикл: замена завершившихся процессов, перезагрузка данных, остановка
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+
+        self.prepare()
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"Сервер запущен: {self.workers} рабочих процессов, {self.sock.getsockname()[:2]}")
+
+        last_check = time.monotonic()
+        while not self.stopping:
+            # Завершившиеся рабочие процессы заменяются новыми
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.children:
+                del self.children[pid]
+                if not self.stopping:
+                    self.spawn()
+
+            if WATCH_INTERVAL > 0 and time.monotonic() - last_check >= WATCH_INTERVAL:
+                last_check = time.monotonic()
+                self.reload_requested = True
+            if self.reload_requested:
+                self.reload_requested = False
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Ошибка при перезагрузке данных: {e}", file=sys.stderr)
+            time.sleep(0.2)
+
+        for pid in list(self.children):
+            self.retire(pid)
+
+    def request_reload(self, *_):
+        self.reload_requested = True
+
+    def stop(self, *_):
+        self.stopping = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Многопроцессный запуск приложения')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument('--threaded', action='store_true', help='обрабатывать запросы в потоках внутри процесса')
+    parser.add_argument('--access-log', action='store_true', help='журнал каждого запроса')
+    args = parser.parse_args()
+
+    sock = listen(args.host, args.port)
+
+    # Данные и индексы загружаются один раз, до создания рабочих процессов
+    import app as app_module
+    app_module.app.debug = False
+    # /admin/reload в рабочих процессах передает перезагрузку родительскому процессу
+    app_module.MULTIPROCESS = True
+
+    Supervisor(app_module, sock, args.workers, args.threaded, args.access_log).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# snapshot.py - Колоночный бинарный снимок набора данных спидтестов
+#
+# Разбор xlsx через openpyxl занимает десятки секунд на полных выгрузках,
+# поэтому исходный файл один раз конвертируется в набор .npy-файлов.
+# Числовые колонки одного типа хранятся одним двумерным блоком, который
+# открывается через mmap: все воркеры разделяют одни и те же страницы памяти.
+# Строковые колонки хранятся как коды + словарь уникальных значений;
+# object-колонки только из чисел сохраняются как числовые.
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Версия формата снимка: при изменении структуры файлов снимки пересобираются
+SNAPSHOT_FORMAT = 2
+
+# Каталог для снимков по умолчанию
+SNAPSHOT_DIR = os.path.join('data', 'snapshot')
+
+
+# Функция для вычисления SHA-256 исходного файла
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Функция для получения отпечатка исходного файла (mtime, размер, хэш)
+def file_fingerprint(path, sha256=None):
+    st = os.stat(path)
+    return {
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+        'sha256': sha256 or file_sha256(path)
+    }
+
+
+# Путь к указателю на актуальный снимок для исходного файла
+def _pointer_path(source_path, snapshot_dir):
+    return os.path.join(snapshot_dir, os.path.basename(source_path) + '.json')
+
+
+# Путь к каталогу снимка для конкретного содержимого файла
+def _bundle_path(source_path, sha256, snapshot_dir):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(snapshot_dir, f"{name}-{sha256[:16]}")
+
+
+# Функция для приведения object-колонки без строк к числовому типу (None, если нельзя)
+def _numeric_object(series):
+    values = series.dropna()
+    if any(isinstance(v, (str, bytes)) for v in values):
+        return None
+    try:
+        numeric = pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return None
+    if isinstance(numeric.dtype, np.dtype) and numeric.dtype.kind in 'biuf':
+        return numeric
+    return None
+
+
+# Функция для чтения исходного файла в DataFrame
+def read_source(source_path):
+    if source_path.endswith('.csv'):
+        return pd.read_csv(source_path)
+    return pd.read_excel(source_path)
+
+
+# Функция для записи DataFrame в каталог снимка
+def write_snapshot(data, bundle_dir, fingerprint=None):
+    parent = os.path.dirname(os.path.abspath(bundle_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+
+    try:
+        columns = []
+        blocks = {}
+        # Колонки, приведенные к числовому типу: имя -> Series
+        converted = {}
+
+        for name in data.columns:
+            series = data[name]
+            if series.dtype == object:
+                numeric = _numeric_object(series)
+                if numeric is not None:
+                    series = converted[name] = numeric
+                elif any(not isinstance(v, str) for v in series.dropna()):
+                    # Значения восстановятся строками: числа в таких колонках меняют тип
+                    print(f"Снимок данных: колонка {name} со смешанными значениями сохраняется как строки")
+            dtype = series.dtype
+            if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+                # Числовые колонки группируются в блоки по типу
+                key = dtype.str
+                blocks.setdefault(key, []).append(name)
+                columns.append({'name': str(name), 'kind': 'block', 'dtype': key})
+            else:
+                # Строковые и смешанные колонки хранятся как коды + словарь
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                idx = len(columns)
+                np.save(os.path.join(tmp_dir, f"codes_{idx}.npy"), codes.astype(np.int32))
+                np.save(os.path.join(tmp_dir, f"values_{idx}.npy"),
+                        np.asarray([str(v) for v in uniques], dtype=str))
+                columns.append({'name': str(name), 'kind': 'codes'})
+
+        block_files = {}
+        for i, (key, names) in enumerate(blocks.items()):
+            # Блок хранится в раскладке (колонки, строки) - как внутри pandas
+            block = np.empty((len(names), len(data)), dtype=np.dtype(key))
+            for j, name in enumerate(names):
+                block[j] = converted[name].to_numpy() if name in converted else data[name].to_numpy()
+            filename = f"block_{i}.npy"
+            np.save(os.path.join(tmp_dir, filename), block)
+            block_files[key] = {'file': filename, 'columns': [str(n) for n in names]}
+
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'rows': int(len(data)),
+            'columns': columns,
+            'blocks': block_files,
+            'source': fingerprint or {}
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # Атомарно публикуем готовый снимок
+        if os.path.isdir(bundle_dir):
+            shutil.rmtree(bundle_dir)
+        os.replace(tmp_dir, bundle_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return bundle_dir
+
+
+# Функция для загрузки снимка из каталога (числовые блоки через mmap)
+def read_snapshot(bundle_dir, mmap=True):
+    with open(os.path.join(bundle_dir, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Неподдерживаемый формат снимка: {meta.get('format')}")
+
+    mmap_mode = 'r' if mmap else None
+    block_columns = {}
+    data = None
+    for info in meta['blocks'].values():
+        block = np.load(os.path.join(bundle_dir, info['file']), mmap_mode=mmap_mode)
+        # Транспонирование без копирования сохраняет один блок над mmap
+        frame = pd.DataFrame(block.T, columns=info['columns'], copy=False)
+        if data is None:
+            data = frame
+        else:
+            for name in info['columns']:
+                block_columns[name] = frame[name]
+    if data is None:
+        data = pd.DataFrame(index=pd.RangeIndex(meta['rows']))
+
+    # Восстанавливаем остальные колонки в исходном порядке
+    for idx, column in enumerate(meta['columns']):
+        name = column['name']
+        if column['kind'] == 'block':
+            if name in block_columns:
+                data.insert(idx, name, block_columns[name])
+            continue
+        codes = np.load(os.path.join(bundle_dir, f"codes_{idx}.npy"))
+        uniques = np.load(os.path.join(bundle_dir, f"values_{idx}.npy")).astype(object)
+        values = np.empty(len(codes), dtype=object)
+        values[:] = np.nan
+        present = codes >= 0
+        values[present] = uniques[codes[present]]
+        data.insert(idx, name, values)
+
+    return data
+
+
+# Готов ли снимок в каталоге (снимки прежнего формата собираются заново)
+def _snapshot_ready(bundle_dir):
+    try:
+        with open(os.path.join(bundle_dir, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f).get('format') == SNAPSHOT_FORMAT
+    except (OSError, ValueError):
+        return False
+
+
+# Функция для поиска актуального снимка; при необходимости снимок собирается
+def ensure_snapshot(source_path, snapshot_dir=SNAPSHOT_DIR):
+    st = os.stat(source_path)
+    pointer = _pointer_path(source_path, snapshot_dir)
+
+    # Быстрый путь: mtime и размер совпадают с указателем - хэш не считаем
+    try:
+        with open(pointer, encoding='utf-8') as f:
+            known = json.load(f)
+        bundle_dir = _bundle_path(source_path, known['sha256'], snapshot_dir)
+        if (known.get('mtime_ns') == st.st_mtime_ns and known.get('size') == st.st_size
+                and _snapshot_ready(bundle_dir)):
+            return bundle_dir
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Файл изменился (или снимка нет): проверяем содержимое по хэшу
+    fingerprint = file_fingerprint(source_path)
+    bundle_dir = _bundle_path(source_path, fingerprint['sha256'], snapshot_dir)
+    if not _snapshot_ready(bundle_dir):
+        write_snapshot(read_source(source_path), bundle_dir, fingerprint)
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_pointer = pointer + '.tmp'
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f)
+    os.replace(tmp_pointer, pointer)
+    return bundle_dir
+
+
+# Функция для удаления снимков прежних версий исходного файла (keep - версия, которую оставляем)
+def prune_snapshots(source_path, snapshot_dir=SNAPSHOT_DIR, keep=None):
+    prefix = os.path.splitext(os.path.basename(source_path))[0] + '-'
+    try:
+        names = os.listdir(snapshot_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(snapshot_dir, name)
+        if name.startswith(prefix) and name != prefix + str(keep) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Функция для загрузки набора данных вместе с его версией (хэшем содержимого).
+# Версия используется для инвалидации производных кэшей (тайлы, статистика)
+def load_versioned_dataset(source_path, snapshot_dir=SNAPSHOT_DIR):
+    try:
+        bundle_dir = ensure_snapshot(source_path, snapshot_dir)
+    except OSError as e:
+        # Например, каталог данных доступен только для чтения
+        print(f"Не удалось подготовить снимок данных: {e}")
+        return read_source(source_path), file_sha256(source_path)[:16]
+    return read_snapshot(bundle_dir), bundle_dir.rsplit('-', 1)[-1]
+
+
+# Функция для загрузки набора данных: из снимка, а при ошибке - из исходного файла
+def load_dataset(source_path, snapshot_dir=SNAPSHOT_DIR):
+    return load_versioned_dataset(source_path, snapshot_dir)[0]
+
+
+# Запуск как отдельного шага загрузки: python snapshot.py [путь к xlsx]
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'cbm_st_pro_1.xlsx')
+    bundle = ensure_snapshot(source)
+    print(f"Снимок данных готов: {bundle}")
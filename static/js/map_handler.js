@@ -5,6 +5,26 @@ let map;
 let markers = [];
 let heatLayer;
 let markerCluster;
+let rollupLayer;
+let clusterRequestId = 0;
+
+// Масштаб, начиная с которого точки загружаются без кластеризации (clustering.LEAF_ZOOM)
+const leafZoom = 17;
+
+// Уровни агрегации хороплета по масштабу карты (rollups.LEVELS)
+const rollupLevels = [
+    { maxZoom: 9, level: 'city' },
+    { maxZoom: 11, level: 'geohash5' },
+    { maxZoom: 14, level: 'geohash6' },
+    { maxZoom: Infinity, level: 'geohash7' }
+];
+
+// Биты провайдеров в маске точки (map_payload.PROVIDER_BITS)
+const providerBits = {
+    'kt': 1,
+    'beeline': 2,
+    'almatv': 4
+};
 
 // Цвета для маркеров по провайдерам
 const providerColors = {
@@ -97,6 +117,14 @@ function setupEventListeners() {
         });
     });
     
+    // При перемещении карты кластеры и ячейки хороплета запрашиваются заново
+    map.on('moveend', function() {
+        const mapType = getSelectedMapType();
+        if (mapType === 'points' || mapType === 'choropleth') {
+            loadMapData();
+        }
+    });
+    
     // Обработчики переключения провайдера
     document.querySelectorAll('input[name="provider"]').forEach(function(radio) {
         radio.addEventListener('change', function() {
@@ -125,147 +153,389 @@ function resetFilters() {
     updateSpeedRangeValue();
 }
 
-// Загрузка данных карты с сервера
-function loadMapData() {
-    // Получаем выбранного провайдера
+// Получение выбранного провайдера
+function getSelectedProvider() {
     let provider = 'all';
     document.querySelectorAll('input[name="provider"]').forEach(function(radio) {
         if (radio.checked) {
             provider = radio.value;
         }
     });
+    return provider;
+}
+
+// Получение выбранного режима отображения
+function getSelectedMapType() {
+    let mapType = 'points';
+    document.querySelectorAll('input[name="mapType"]').forEach(function(radio) {
+        if (radio.checked) {
+            mapType = radio.value;
+        }
+    });
+    return mapType;
+}
+
+// Загрузка данных карты с сервера
+function loadMapData() {
+    // Получаем выбранного провайдера
+    const provider = getSelectedProvider();
     
     // Получаем диапазон скорости
     const maxSpeed = document.getElementById('speedRange').value;
     const minSpeed = 0;
     
     // Получаем режим отображения
-    let mapType = 'points';
-    document.querySelectorAll('input[name="mapType"]').forEach(function(radio) {
-        if (radio.checked) {
-            mapType = radio.value;
+    const mapType = getSelectedMapType();
+    
+    // Точки кластеризуются на сервере по текущей области просмотра;
+    // при крупном масштабе точки загружаются в бинарном формате
+    if (mapType === 'points') {
+        if (map.getZoom() >= leafZoom) {
+            loadPoints(provider, minSpeed, maxSpeed);
+        } else {
+            loadClusters(provider, minSpeed, maxSpeed);
         }
-    });
+        return;
+    }
     
-    // Формируем URL для запроса
-    const url = `/get_map?provider=${provider}&min_speed=${minSpeed}&max_speed=${maxSpeed}&map_type=${mapType}`;
+    // Хороплет строится по готовым агрегатам, без исходных точек
+    if (mapType === 'choropleth') {
+        loadRollup(provider);
+        return;
+    }
+    
+    // Тепловые карты отображаются готовыми тайлами с сервера
+    if (mapType.startsWith('heatmap')) {
+        loadHeatmapTiles(mapType, provider, minSpeed, maxSpeed);
+    }
+}
+
+// Подключение слоя тайлов тепловой карты
+function loadHeatmapTiles(mapType, provider, minSpeed, maxSpeed) {
+    // Ответы кластеров, точек и хороплета, запрошенные до переключения,
+    // больше не применяются (иначе их clearMap() удалит слой тайлов)
+    ++clusterRequestId;
+    
+    // Очищаем текущие маркеры и слои
+    clearMap();
+    
+    const layer = mapType === 'heatmap_speed' ? 'speed' : 'density';
+    const url = `/tiles/{z}/{x}/{y}?layer=${layer}&provider=${provider}&min_speed=${minSpeed}&max_speed=${maxSpeed}`;
+    
+    heatLayer = L.tileLayer(url, {
+        opacity: 0.8,
+        maxZoom: 20
+    }).addTo(map);
+}
+
+// Загрузка кластеров для текущей области просмотра и масштаба
+function loadClusters(provider, minSpeed, maxSpeed) {
+    const bbox = map.getBounds().toBBoxString();
+    const zoom = map.getZoom();
+    const url = `/get_clusters?provider=${provider}&min_speed=${minSpeed}&max_speed=${maxSpeed}&bbox=${bbox}&zoom=${zoom}`;
+    
+    // Ответы на устаревшие запросы (после нового перемещения карты) игнорируются
+    const requestId = ++clusterRequestId;
     
-    // Отправляем запрос на сервер
     fetch(url)
         .then(response => {
             if (!response.ok) {
-                throw new Error('Ошибка при загрузке данных карты');
+                throw new Error('Ошибка при загрузке кластеров');
             }
             return response.json();
         })
         .then(data => {
-            // Обрабатываем полученные данные
-            updateMap(data, mapType);
-            
-            // Обновляем статистику
-            // loadStatistics(provider, minSpeed, maxSpeed); // Статистика обновляется отдельно
+            if (requestId === clusterRequestId) {
+                updateClusters(data);
+            }
         })
         .catch(error => {
-            console.error('Ошибка при загрузке данных карты:', error);
+            console.error('Ошибка при загрузке кластеров:', error);
         });
 }
 
-// Обновление карты на основе полученных данных
-function updateMap(data, mapType) {
+// Загрузка отдельных точек области просмотра в бинарном формате
+function loadPoints(provider, minSpeed, maxSpeed) {
+    const bbox = map.getBounds().toBBoxString();
+    const url = `/get_map?map_type=points&format=binary&provider=${provider}&min_speed=${minSpeed}&max_speed=${maxSpeed}&bbox=${bbox}`;
+    
+    // Используется тот же счетчик, что и для кластеров: важен только последний запрос
+    const requestId = ++clusterRequestId;
+    
+    fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Ошибка при загрузке точек');
+            }
+            return response.arrayBuffer();
+        })
+        .then(buffer => {
+            if (requestId === clusterRequestId) {
+                updatePoints(decodeBinaryPoints(buffer));
+            }
+        })
+        .catch(error => {
+            console.error('Ошибка при загрузке точек:', error);
+        });
+}
+
+// Разбор бинарного ответа /get_map?format=binary (см. map_payload.py):
+// заголовок 20 байт, Float32-колонки, маска провайдеров, коды и таблица адресов
+function decodeBinaryPoints(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    if (magic !== 'KTPT' || view.getUint8(4) !== 1) {
+        throw new Error('Неизвестный формат ответа');
+    }
+    const codeSize = view.getUint8(6);
+    const count = view.getUint32(8, true);
+    const addressBytes = view.getUint32(16, true);
+    
+    // Колонки читаются без копирования: смещения выровнены на 4 байта
+    let offset = 20;
+    const column = () => {
+        const values = new Float32Array(buffer, offset, count);
+        offset += count * 4;
+        return values;
+    };
+    const points = { count: count, lat: column(), lng: column() };
+    
+    // Тепловая карта: третья колонка - значение
+    if (view.getUint8(5) === 1) {
+        points.value = column();
+        return points;
+    }
+    points.speed = column();
+    
+    points.providers = new Uint8Array(buffer, offset, count);
+    offset += count + (4 - count % 4) % 4;
+    
+    const CodeArray = codeSize === 2 ? Uint16Array : Uint32Array;
+    points.addressCodes = new CodeArray(buffer, offset, count);
+    offset += count * codeSize;
+    offset += (4 - offset % 4) % 4;
+    
+    points.addresses = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, offset, addressBytes)));
+    return points;
+}
+
+// Точка с номером i из колоночного представления (для создания маркера)
+function pointAt(points, i) {
+    const mask = points.providers[i];
+    return {
+        lat: points.lat[i],
+        lng: points.lng[i],
+        speed: points.speed[i],
+        address: points.addresses[points.addressCodes[i]],
+        providers: {
+            kt: (mask & providerBits.kt) !== 0,
+            beeline: (mask & providerBits.beeline) !== 0,
+            almatv: (mask & providerBits.almatv) !== 0
+        }
+    };
+}
+
+// Отображение отдельных точек из колоночного представления
+function updatePoints(points) {
     // Очищаем текущие маркеры
     clearMap();
     
-    // Если данных нет, выходим
-    if (!data || data.length === 0) {
-        console.log('Нет данных для отображения на карте');
-        return;
+    markerCluster = L.layerGroup();
+    
+    for (let i = 0; i < points.count; i++) {
+        const marker = createPointMarker(pointAt(points, i));
+        markerCluster.addLayer(marker);
+        markers.push(marker);
     }
     
-    // В зависимости от типа карты отображаем точки или тепловую карту
-    if (mapType === 'points') {
-        // Создаем кластер маркеров для группировки
-        markerCluster = L.markerClusterGroup();
-        
-        // Добавляем маркеры
-        data.forEach(point => {
-            // Определяем иконку в зависимости от скорости
-            let icon;
-            if (point.speed < 50) {
-                icon = speedIcons.low;
-            } else if (point.speed < 100) {
-                icon = speedIcons.medium;
-            } else {
-                icon = speedIcons.high;
-            }
-            
-            // Создаем маркер
-            const marker = L.marker([point.lat, point.lng], { icon: icon });
-
-            // Добавьте этот код перед строкой 205
-            let imageUrl = "/static/img/point-default.png"; // По умолчанию
-            if (point.providers.kt ) {
-                imageUrl = "/static/img/provider-kt.png";
-            } else if (point.providers.beeline) {
-                imageUrl = "/static/img/provider-beeline.png";
-            } else if (point.providers.almatv) {
-                imageUrl = "/static/img/provider-almatv.png";
-            }
-            
-            // Создаем всплывающее окно с информацией и картинкой
-            let popupContent = `
-                <div class="marker-popup">
-                    <img src="https://via.placeholder.com/150" alt="Placeholder Image">
-                    <h5>Точка интернета</h5>
-                    <p><strong>Адрес:</strong> ${point.address || 'Не указан'}</p>
-                    <p><strong>Скорость:</strong> ${point.speed.toFixed(1)} Мбит/с</p>
-                    <p><strong>Провайдеры:</strong></p>
-                    <ul>
-            `;
-            
-            if (point.providers.kt) {
-                popupContent += `<li><span style="color: ${providerColors.kt}">■</span> Казахтелеком</li>`;
+    map.addLayer(markerCluster);
+}
+
+// Загрузка агрегатов покрытия (по городам или ячейкам geohash) для области просмотра
+function loadRollup(provider) {
+    const zoom = map.getZoom();
+    const level = rollupLevels.find(item => zoom <= item.maxZoom).level;
+    const bbox = map.getBounds().toBBoxString();
+    const url = `/get_rollup?level=${level}&bbox=${bbox}`;
+    
+    const requestId = ++clusterRequestId;
+    
+    fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Ошибка при загрузке агрегатов');
             }
-            if (point.providers.beeline) {
-                popupContent += `<li><span style="color: ${providerColors.beeline}">■</span> Beeline</li>`;
+            return response.json();
+        })
+        .then(data => {
+            if (requestId === clusterRequestId) {
+                updateRollup(data, provider);
             }
-            if (point.providers.almatv) {
-                popupContent += `<li><span style="color: ${providerColors.almatv}">■</span> AlmaTV</li>`;
+        })
+        .catch(error => {
+            console.error('Ошибка при загрузке агрегатов:', error);
+        });
+}
+
+// Цвет ячейки хороплета: для всех провайдеров - лидер по медианной скорости,
+// для выбранного провайдера - его медианная скорость
+function rollupColor(cell, provider, lowSpeed) {
+    if (provider === 'all') {
+        let leader = null;
+        Object.keys(cell.providers).forEach(name => {
+            const median = cell.providers[name].median_speed;
+            if (median !== null && (leader === null || median > cell.providers[leader].median_speed)) {
+                leader = name;
             }
-            
-            popupContent += `
-                    </ul>
-                </div>
-            `;
-            
-            marker.bindPopup(popupContent);
-            
-            // Добавляем маркер в кластер
-            markerCluster.addLayer(marker);
-            
-            // Сохраняем маркер в массиве для возможности очистки
-            markers.push(marker);
+        });
+        return leader ? providerColors[leader] : '#999999';
+    }
+    
+    const median = cell.providers[provider].median_speed;
+    if (median === null) {
+        return '#999999';
+    }
+    if (median < lowSpeed) {
+        return 'red';
+    }
+    return median < 100 ? 'orange' : 'green';
+}
+
+// Отображение ячеек хороплета
+function updateRollup(data, provider) {
+    // Очищаем текущие маркеры и слои
+    clearMap();
+    
+    rollupLayer = L.layerGroup();
+    
+    const names = { kt: 'Казахтелеком', beeline: 'Beeline', almatv: 'AlmaTV' };
+    data.cells.forEach(cell => {
+        const [west, south, east, north] = cell.bounds;
+        const color = rollupColor(cell, provider, data.low_speed);
+        const rectangle = L.rectangle([[south, west], [north, east]], {
+            color: color,
+            weight: 1,
+            fillColor: color,
+            fillOpacity: 0.45
         });
         
-        // Добавляем кластер на карту
-        map.addLayer(markerCluster);
-        
-        // Подгоняем масштаб карты под все маркеры, если их больше одного
-        if (data.length > 1) {
-            const bounds = markerCluster.getBounds();
-            map.fitBounds(bounds);
-        }
-    } else if (mapType.startsWith('heatmap')) {
-        // Подготавливаем данные для тепловой карты
-        const heatData = data.map(point => [point.lat, point.lng, point.value]);
+        // Подсказка со сравнением провайдеров в ячейке
+        let tooltip = `<strong>${cell.id}</strong><br><strong>Точек:</strong> ${cell.count}<br>`;
+        Object.keys(names).forEach(name => {
+            const stats = cell.providers[name];
+            const median = stats.median_speed === null ? '—' : `${stats.median_speed.toFixed(1)} Мбит/с`;
+            const lowShare = stats.low_share === null ? '—' : `${Math.round(stats.low_share * 100)}%`;
+            tooltip += `<span style="color: ${providerColors[name]}">■</span> ${names[name]}: ` +
+                `${stats.count}, медиана ${median}, < ${data.low_speed} Мбит/с: ${lowShare}<br>`;
+        });
+        rectangle.bindTooltip(tooltip);
         
-        // Создаем тепловую карту
-        heatLayer = L.heatLayer(heatData, {
-            radius: 25,
-            blur: 15,
-            maxZoom: 17,
-            gradient: {0.4: 'blue', 0.6: 'lime', 0.8: 'yellow', 1: 'red'}
-        }).addTo(map);
+        rollupLayer.addLayer(rectangle);
+    });
+    
+    map.addLayer(rollupLayer);
+}
+
+// Отображение кластеров и отдельных точек
+function updateClusters(data) {
+    // Очищаем текущие маркеры
+    clearMap();
+    
+    markerCluster = L.layerGroup();
+    
+    // Кластеры отображаются значком с количеством точек
+    data.clusters.forEach(cluster => {
+        markerCluster.addLayer(createClusterMarker(cluster));
+    });
+    
+    // Отдельные точки отображаются обычными маркерами
+    data.points.forEach(point => {
+        const marker = createPointMarker(point);
+        markerCluster.addLayer(marker);
+        markers.push(marker);
+    });
+    
+    map.addLayer(markerCluster);
+}
+
+// Создание маркера кластера
+function createClusterMarker(cluster) {
+    let sizeClass = 'small';
+    if (cluster.count >= 1000) {
+        sizeClass = 'large';
+    } else if (cluster.count >= 100) {
+        sizeClass = 'medium';
     }
+    
+    const icon = L.divIcon({
+        html: `<div><span>${cluster.count}</span></div>`,
+        className: `marker-cluster marker-cluster-${sizeClass}`,
+        iconSize: L.point(40, 40)
+    });
+    const marker = L.marker([cluster.lat, cluster.lng], { icon: icon });
+    
+    // Подсказка со сводкой по кластеру
+    marker.bindTooltip(`
+        <strong>Точек:</strong> ${cluster.count}<br>
+        <strong>Средняя скорость:</strong> ${cluster.mean_speed.toFixed(1)} Мбит/с<br>
+        <strong>Минимальная скорость:</strong> ${cluster.min_speed.toFixed(1)} Мбит/с<br>
+        <span style="color: ${providerColors.kt}">■</span> ${cluster.providers.kt}
+        <span style="color: ${providerColors.beeline}">■</span> ${cluster.providers.beeline}
+        <span style="color: ${providerColors.almatv}">■</span> ${cluster.providers.almatv}
+    `);
+    
+    // По клику приближаем карту к кластеру
+    marker.on('click', function() {
+        map.setView([cluster.lat, cluster.lng], map.getZoom() + 2);
+    });
+    
+    return marker;
+}
+
+// Создание маркера отдельной точки
+function createPointMarker(point) {
+    // Определяем иконку в зависимости от скорости
+    let icon;
+    if (point.speed < 50) {
+        icon = speedIcons.low;
+    } else if (point.speed < 100) {
+        icon = speedIcons.medium;
+    } else {
+        icon = speedIcons.high;
+    }
+    
+    // Создаем маркер
+    const marker = L.marker([point.lat, point.lng], { icon: icon });
+    
+    // Создаем всплывающее окно с информацией и картинкой
+    let popupContent = `
+        <div class="marker-popup">
+            <img src="https://via.placeholder.com/150" alt="Placeholder Image">
+            <h5>Точка интернета</h5>
+            <p><strong>Адрес:</strong> ${point.address || 'Не указан'}</p>
+            <p><strong>Скорость:</strong> ${point.speed.toFixed(1)} Мбит/с</p>
+            <p><strong>Провайдеры:</strong></p>
+            <ul>
+    `;
+    
+    if (point.providers.kt) {
+        popupContent += `<li><span style="color: ${providerColors.kt}">■</span> Казахтелеком</li>`;
+    }
+    if (point.providers.beeline) {
+        popupContent += `<li><span style="color: ${providerColors.beeline}">■</span> Beeline</li>`;
+    }
+    if (point.providers.almatv) {
+        popupContent += `<li><span style="color: ${providerColors.almatv}">■</span> AlmaTV</li>`;
+    }
+    
+    popupContent += `
+            </ul>
+        </div>
+    `;
+    
+    marker.bindPopup(popupContent);
+    
+    return marker;
 }
 
 // Очистка карты от маркеров и тепловых слоев
@@ -287,6 +557,11 @@ function clearMap() {
     if (heatLayer && map.hasLayer(heatLayer)) {
         map.removeLayer(heatLayer);
     }
+    
+    // Удаляем ячейки хороплета
+    if (rollupLayer && map.hasLayer(rollupLayer)) {
+        map.removeLayer(rollupLayer);
+    }
 }
 
 // Загрузка статистики
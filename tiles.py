@@ -0,0 +1,214 @@
+# tiles.py - Растровые тайлы тепловых карт (плотность и скорость)
+#
+# Вместо отправки всех точек в браузер (leaflet.heat) сервер отдает PNG-тайлы
+# /tiles/{z}/{x}/{y}: точки тайла бинируются векторно по сетке TILE_BINS x TILE_BINS,
+# после чего бины окрашиваются градиентом тепловой карты. Точки отсортированы
+# по координате x проекции, поэтому тайл читает только свою полосу данных.
+# Готовые тайлы кэшируются на диске в каталоге версии набора данных:
+# каталоги прежних версий удаляются после замены версии (prune_tile_cache). На диск попадают только варианты
+# фильтра, которые выставляет интерфейс (провайдер и положение слайдера
+# скорости), чтобы произвольные параметры запросов не заполняли диск;
+# остальные тайлы отрисовываются без кэша.
+import hashlib
+import os
+import shutil
+import struct
+import zlib
+
+import numpy as np
+
+from clustering import mercator
+
+TILE_SIZE = 256
+
+# Количество бинов тайла по одной оси (бин = 4 пикселя)
+TILE_BINS = 64
+
+MAX_TILE_ZOOM = 20
+
+# Количество точек в бине, при котором плотность считается максимальной
+DENSITY_SATURATION = 50
+
+# Средняя скорость (Мбит/с), при которой бин скорости окрашивается максимально
+SPEED_SATURATION = 200
+
+LAYERS = ('density', 'speed')
+
+# Каталог кэша тайлов по умолчанию
+TILE_CACHE_DIR = os.path.join('data', 'tiles')
+
+# Слайдер максимальной скорости в интерфейсе: 0..500 с шагом 10 (templates/index.html)
+CACHED_SPEED_STEP = 10
+CACHED_MAX_SPEED = 500
+
+# Градиент, как у leaflet.heat: {0.4: 'blue', 0.6: 'lime', 0.8: 'yellow', 1: 'red'}
+GRADIENT_STOPS = [0.0, 0.4, 0.6, 0.8, 1.0]
+GRADIENT_COLORS = np.array([
+    [0, 0, 255],
+    [0, 0, 255],
+    [0, 255, 0],
+    [255, 255, 0],
+    [255, 0, 0]
+], dtype=float)
+
+
+# Таблица цветов RGBA на 256 уровней интенсивности
+def _build_palette():
+    levels = np.linspace(0.0, 1.0, 256)
+    palette = np.empty((256, 4), dtype=np.uint8)
+    for channel in range(3):
+        palette[:, channel] = np.interp(levels, GRADIENT_STOPS, GRADIENT_COLORS[:, channel])
+    palette[:, 3] = (90 + 140 * levels).astype(np.uint8)
+    return palette
+
+
+PALETTE = _build_palette()
+
+
+# Функция для кодирования RGBA-массива (высота, ширина, 4) в PNG
+def encode_png(rgba):
+    height, width, _ = rgba.shape
+    # Каждая строка PNG начинается с байта фильтра (0 - без фильтра)
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)], axis=1)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+# Функция для удаления каталогов кэша прежних версий (keep - версия, которую оставляем)
+def prune_tile_cache(cache_dir, keep=None):
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        if name != keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class TileRenderer:
+    # cache_dir=None - тайлы не кэшируются на диске
+    def __init__(self, data_index, version, cache_dir=None):
+        self.index = data_index
+        self.version = version
+
+        # Точки, отсортированные по x проекции Web Mercator
+        x, y = mercator(data_index.lat, data_index.lng)
+        self.x_order = np.argsort(x, kind='stable')
+        self.x_sorted = x[self.x_order]
+        self.y_sorted = y[self.x_order]
+
+        self.cache_dir = self._prepare_cache(cache_dir)
+
+    # Подготовка каталога кэша текущей версии (прежние версии еще обслуживают
+    # запросы, их каталоги удаляются после замены версии)
+    def _prepare_cache(self, cache_dir):
+        if cache_dir is None:
+            return None
+        try:
+            version_dir = os.path.join(cache_dir, self.version)
+            os.makedirs(version_dir, exist_ok=True)
+            return version_dir
+        except OSError as e:
+            print(f"Кэш тайлов отключен: {e}")
+            return None
+
+    # Путь к файлу тайла в кэше (вариант определяется слоем и параметрами фильтра)
+    def _cache_path(self, layer, query, z, x, y):
+        variant = hashlib.sha1(repr((layer,) + query.key()).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{layer}-{query.provider}-{variant}", str(z), str(x), f"{y}.png")
+
+    # Сохраняется ли тайл на диск: без фильтров, кроме провайдера и слайдера
+    # скорости (min_speed не задан или 0, max_speed - одно из положений слайдера)
+    @staticmethod
+    def cacheable(query):
+        if query.min_upload is not None or query.max_upload is not None or query.city is not None:
+            return False
+        if query.bbox is not None or query.min_speed not in (None, 0):
+            return False
+        return query.max_speed is None or (0 <= query.max_speed <= CACHED_MAX_SPEED and
+                                           query.max_speed % CACHED_SPEED_STEP == 0)
+
+    # Функция для получения PNG тайла (из кэша или с отрисовкой)
+    def tile(self, layer, query, z, x, y):
+        if self.cache_dir is None or not self.cacheable(query):
+            return self.render(layer, query, z, x, y)
+
+        path = self._cache_path(layer, query, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        png = self.render(layer, query, z, x, y)
+        # Пустые тайлы отрисовываются мгновенно, их не сохраняем
+        if png is EMPTY_TILE:
+            return png
+        # Каталог версии удален после замены: запросы, начатые до нее, не
+        # должны создавать его заново
+        if not os.path.isdir(self.cache_dir):
+            return png
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Не удалось сохранить тайл в кэш: {e}")
+        return png
+
+    # Функция для бинирования точек тайла: количество и сумма скорости в каждом бине
+    def bin_tile(self, query, z, x, y):
+        scale = float(1 << z)
+        lo = np.searchsorted(self.x_sorted, x / scale, side='left')
+        hi = np.searchsorted(self.x_sorted, (x + 1) / scale, side='left')
+
+        # Полоса тайла по x; далее отбор по y и фильтрам запроса
+        ty = self.y_sorted[lo:hi] * scale - y
+        inside = (ty >= 0) & (ty < 1)
+        candidates = self.x_order[lo:hi][inside]
+        keep = query.mask(self.index, candidates)
+        tx = self.x_sorted[lo:hi][inside][keep] * scale - x
+        ty = ty[inside][keep]
+        positions = candidates[keep]
+
+        speed = self.index.speed[query.provider][positions]
+        present = ~np.isnan(speed)
+        bx = np.minimum((tx[present] * TILE_BINS).astype(np.int64), TILE_BINS - 1)
+        by = np.minimum((ty[present] * TILE_BINS).astype(np.int64), TILE_BINS - 1)
+        cells = by * TILE_BINS + bx
+        count = np.bincount(cells, minlength=TILE_BINS * TILE_BINS)
+        speed_sum = np.bincount(cells, weights=speed[present], minlength=TILE_BINS * TILE_BINS)
+        return count.reshape(TILE_BINS, TILE_BINS), speed_sum.reshape(TILE_BINS, TILE_BINS)
+
+    # Функция для отрисовки тайла в PNG
+    def render(self, layer, query, z, x, y):
+        count, speed_sum = self.bin_tile(query, z, x, y)
+        filled = count > 0
+        if not filled.any():
+            return EMPTY_TILE
+
+        if layer == 'speed':
+            intensity = np.divide(speed_sum, count, out=np.zeros_like(speed_sum), where=filled) / SPEED_SATURATION
+        else:
+            intensity = np.log1p(count) / np.log1p(DENSITY_SATURATION)
+        levels = (np.clip(intensity, 0.0, 1.0) * 255).astype(np.uint8)
+
+        rgba = PALETTE[levels]
+        rgba[~filled] = 0
+
+        # Увеличиваем сетку бинов до размера тайла
+        factor = TILE_SIZE // TILE_BINS
+        rgba = np.repeat(np.repeat(rgba, factor, axis=0), factor, axis=1)
+        return encode_png(rgba)